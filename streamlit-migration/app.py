@@ -1,10 +1,13 @@
 import streamlit as st
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 import pandas as pd
-import json
+from openpyxl import Workbook
+import orjson
 from datetime import datetime
 import io
+import os
 from typing import Dict, List, Any
 
 # ============================================================================
@@ -20,58 +23,21 @@ st.set_page_config(
 # ============================================================================
 # CUSTOM CSS - BROADCOM INSPIRED STYLING
 # ============================================================================
-st.markdown("""
-    <style>
-    .main-header {
-        background: linear-gradient(135deg, #0066CC 0%, #004499 100%);
-        color: white;
-        padding: 2rem;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-        text-align: center;
-    }
-    .stButton>button {
-        background-color: #0066CC;
-        color: white;
-        border-radius: 5px;
-        padding: 0.5rem 2rem;
-        border: none;
-        font-weight: 600;
-    }
-    .stButton>button:hover {
-        background-color: #004499;
-    }
-    .success-box {
-        background-color: #d4edda;
-        border: 1px solid #c3e6cb;
-        border-radius: 5px;
-        padding: 1rem;
-        margin: 1rem 0;
-    }
-    .warning-box {
-        background-color: #fff3cd;
-        border: 1px solid #ffeaa7;
-        border-radius: 5px;
-        padding: 1rem;
-        margin: 1rem 0;
-    }
-    .section-header {
-        background-color: #f1f5f9;
-        padding: 1rem;
-        border-radius: 5px;
-        margin: 1rem 0;
-        font-weight: 600;
-        color: #0066CC;
-    }
-    </style>
-""", unsafe_allow_html=True)
+@st.cache_resource(show_spinner=False)
+def load_css() -> str:
+    """Read the shared stylesheet once per process"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css"), encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+# Injected on every run: Streamlit drops elements that a rerun doesn't re-emit
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # ============================================================================
 # DATABASE CONNECTION
 # ============================================================================
 @st.cache_resource
-def get_db_connection():
-    """Create and cache database connection"""
+def get_pool():
+    """Create and cache a thread-safe database connection pool"""
     try:
         # Read secrets with proper fallback
         db_host = st.secrets.get("DB_HOST") if "DB_HOST" in st.secrets else "localhost"
@@ -79,15 +45,20 @@ def get_db_connection():
         db_name = st.secrets.get("DB_NAME") if "DB_NAME" in st.secrets else "postgres"
         db_user = st.secrets.get("DB_USER") if "DB_USER" in st.secrets else "postgres"
         db_password = st.secrets.get("DB_PASSWORD") if "DB_PASSWORD" in st.secrets else ""
+        # One pool is shared by every session in this process
+        pool_min = int(st.secrets.get("DB_POOL_MIN", 2))
+        pool_max = int(st.secrets.get("DB_POOL_MAX", 20))
         
-        conn = psycopg2.connect(
+        pool = ThreadedConnectionPool(
+            minconn=pool_min,
+            maxconn=pool_max,
             host=db_host,
             port=db_port,
             database=db_name,
             user=db_user,
             password=db_password
         )
-        return conn
+        return pool
     except Exception as e:
         st.error(f"Database connection failed: {str(e)}")
         # Show debug info
@@ -97,32 +68,105 @@ def get_db_connection():
             st.warning("⚠️ Database credentials not found in secrets. Please configure them in Settings → Secrets")
         return None
 
+@contextmanager
+def borrow():
+    """Borrow a connection from the pool and return it when done.
+    
+    Yields None if the pool is unavailable. Connections that raised are
+    closed instead of being handed back, so broken ones aren't recycled.
+    """
+    pool = get_pool()
+    if not pool:
+        yield None
+        return
+    
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        pool.putconn(conn, close=True)
+        raise
+    else:
+        pool.putconn(conn)
+
 def execute_query(query: str, params: tuple = None, fetch: bool = True):
     """Execute database query with error handling"""
-    conn = get_db_connection()
-    if not conn:
-        return None
-    
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, params)
-            if fetch:
-                result = cur.fetchall()
-                return result
-            else:
-                conn.commit()
-                return True
+        with borrow() as conn:
+            if not conn:
+                return None
+            
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                result = cur.fetchall() if fetch else True
+            conn.commit()
+            return result
     except Exception as e:
-        conn.rollback()
         st.error(f"Database error: {str(e)}")
         return None
 
+def _sql_statements(script: str) -> List[str]:
+    """Split a SQL script into statements, keeping $$-quoted function bodies intact"""
+    lines = [line for line in script.splitlines() if not line.lstrip().startswith('--')]
+    statements = []
+    pending = ''
+    for part in '\n'.join(lines).split(';'):
+        pending += part
+        if pending.count('$$') % 2:
+            # Still inside a $$ body, so this semicolon belongs to it
+            pending += ';'
+            continue
+        if pending.strip():
+            statements.append(pending.strip())
+        pending = ''
+    return statements
+
+@st.cache_resource(show_spinner=False)
+def apply_schema_migrations():
+    """Apply idempotent index migrations once per server process
+    
+    Each statement runs behind its own savepoint, so one the database user
+    can't run (e.g. CREATE EXTENSION) doesn't roll back the others. Errors are
+    returned rather than raised so they are cached too and not retried every rerun.
+    """
+    errors = []
+    try:
+        migrations_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_migrations.sql")
+        with open(migrations_path) as f:
+            statements = _sql_statements(f.read())
+        
+        with borrow() as conn:
+            if not conn:
+                return None
+            
+            with conn.cursor() as cur:
+                for statement in statements:
+                    cur.execute("SAVEPOINT migration")
+                    try:
+                        cur.execute(statement)
+                    except psycopg2.Error as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT migration")
+                        errors.append(str(e).strip())
+                    else:
+                        cur.execute("RELEASE SAVEPOINT migration")
+            conn.commit()
+    except Exception as e:
+        errors.append(str(e))
+    return "; ".join(errors) or None
+
 # ============================================================================
 # DATABASE OPERATIONS
 # ============================================================================
 
-def get_all_surveys():
-    """Fetch all available surveys"""
+SURVEY_COLUMNS = ('survey_name', 'description', 'questions', 'created_date', 'updated_date')
+CUSTOMER_COLUMNS = ('customer_id', 'customer_company', 'classification', 'owner')
+
+def _as_records(rows, columns: tuple):
+    """Zip tuple rows with their column names"""
+    return [dict(zip(columns, row)) for row in rows] if rows else rows
+
+def _fetch_all_surveys():
+    """Fetch all available surveys from the database"""
     query = """
         SELECT 
             template_name as survey_name,
@@ -135,6 +179,22 @@ def get_all_surveys():
     """
     return execute_query(query)
 
+@st.cache_data(ttl=300, show_spinner=False)  # Cache for 5 minutes
+def get_all_surveys():
+    """Fetch all available surveys"""
+    return _as_records(_fetch_all_surveys(), SURVEY_COLUMNS)
+
+@st.cache_data(ttl=120, show_spinner=False)  # Cache for 2 minutes
+def _all_customers_page():
+    """Fetch the default (unfiltered) customer list"""
+    query = """
+        SELECT customer_id, customer_company, classification, owner
+        FROM customers 
+        ORDER BY customer_company ASC
+        LIMIT 50
+    """
+    return _as_records(execute_query(query), CUSTOMER_COLUMNS)
+
 def get_customers(search_term: str = ""):
     """Search customers by company name or ID"""
     if search_term:
@@ -145,158 +205,198 @@ def get_customers(search_term: str = ""):
             ORDER BY customer_company ASC
             LIMIT 50
         """
-        return execute_query(query, (f"%{search_term}%", f"%{search_term}%"))
+        return _as_records(execute_query(query, (f"%{search_term}%", f"%{search_term}%")), CUSTOMER_COLUMNS)
     else:
-        query = """
-            SELECT customer_id, customer_company, classification, owner
-            FROM customers 
-            ORDER BY customer_company ASC
-            LIMIT 50
-        """
-        return execute_query(query)
+        return _all_customers_page()
+
+def clear_submission_caches():
+    """Invalidate cached customer lists after a submission upserts a customer"""
+    _all_customers_page.clear()
+    # The partner-mode search results are memoized per session, not by st.cache_data
+    st.session_state.pop('customer_results', None)
+    st.session_state.pop('customer_search', None)
+
+def clear_cache():
+    """Invalidate cached survey and customer lists after a write"""
+    get_all_surveys.clear()
+    clear_submission_caches()
+
+@st.cache_data(ttl=600, show_spinner=False)  # Cache for 10 minutes
+def get_template_meta(template_name: str):
+    """Fetch a template's ID and its questions keyed by (string) question ID"""
+    # questions_by_id comes from an optional migration; reading it through to_jsonb
+    # yields NULL instead of an error when the column doesn't exist
+    results = execute_query(
+        "SELECT id, to_jsonb(t) -> 'questions_by_id', questions FROM templates t WHERE template_name = %s",
+        (template_name,)
+    )
+    if not results:
+        raise Exception(f"Template '{template_name}' not found")
+    template_id, questions_by_id, questions = results[0]
+    if questions_by_id is None:
+        if isinstance(questions, str):
+            questions = orjson.loads(questions)
+        if not isinstance(questions, list):
+            questions = []
+        questions_by_id = {str(q['id']): q for q in questions if isinstance(q, dict) and q.get('id') is not None}
+    return template_id, questions_by_id
 
 def check_existing_responses(customer_id: str, partner_company: str, template_name: str):
     """Check if responses already exist for this combination"""
     query = """
+        WITH latest AS (
+            SELECT s.id
+            FROM submissions s
+            JOIN partners p ON s.partner_id = p.id
+            JOIN templates t ON s.template_id = t.id
+            WHERE s.customer_id = %s 
+            AND p.partner_company = %s 
+            AND t.template_name = %s
+            ORDER BY s.id DESC
+            LIMIT 1
+        )
         SELECT 
             r.question_id, 
             r.response_value, 
             s.submission_date,
             p.partner_name as previous_partner_name,
             c.customer_company
-        FROM responses r
-        JOIN submissions s ON r.submission_id = s.id
+        FROM latest
+        JOIN submissions s ON s.id = latest.id
         JOIN partners p ON s.partner_id = p.id
         JOIN customers c ON s.customer_id = c.customer_id
-        JOIN templates t ON s.template_id = t.id
-        WHERE s.customer_id = %s 
-        AND p.partner_company = %s 
-        AND t.template_name = %s
-        AND s.id = (
-            SELECT MAX(s2.id) 
-            FROM submissions s2 
-            JOIN partners p2 ON s2.partner_id = p2.id
-            JOIN templates t2 ON s2.template_id = t2.id
-            WHERE s2.customer_id = %s
-            AND p2.partner_company = %s
-            AND t2.template_name = %s
-        )
+        JOIN responses r ON r.submission_id = latest.id
     """
-    results = execute_query(query, (customer_id, partner_company, template_name, 
-                                    customer_id, partner_company, template_name))
+    results = execute_query(query, (customer_id, partner_company, template_name))
     
     if results and len(results) > 0:
-        responses = {row['question_id']: row['response_value'] for row in results}
+        responses = {row[0]: row[1] for row in results}
+        _, _, submission_date, previous_partner_name, customer_company = results[0]
         return {
             'has_existing': True,
             'responses': responses,
-            'submission_date': results[0]['submission_date'],
-            'previous_partner_name': results[0]['previous_partner_name'],
-            'customer_company': results[0]['customer_company']
+            'submission_date': submission_date,
+            'previous_partner_name': previous_partner_name,
+            'customer_company': customer_company
         }
     return {'has_existing': False}
 
+def _copy_field(value) -> str:
+    """Format a value for PostgreSQL's text COPY format"""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
 def submit_survey_responses(customer_id: str, customer_company: str, 
                            partner_name: str, partner_company: str,
                            template_name: str, responses: Dict, is_update: bool = False):
     """Submit survey responses to database"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
     try:
-        with conn.cursor() as cur:
-            # Insert or get customer
-            cur.execute("""
-                INSERT INTO customers (customer_id, customer_company) 
-                VALUES (%s, %s) 
-                ON CONFLICT (customer_id) DO UPDATE SET customer_company = %s 
-                RETURNING customer_id
-            """, (customer_id, customer_company, customer_company))
+        with borrow() as conn:
+            if not conn:
+                return False
             
-            # Insert or get partner
-            cur.execute("""
-                INSERT INTO partners (partner_name, partner_company) 
-                VALUES (%s, %s) 
-                ON CONFLICT (partner_name, partner_company) DO UPDATE SET partner_name = %s 
-                RETURNING id
-            """, (partner_name, partner_company, partner_name))
-            partner_id = cur.fetchone()[0]
+            # Get template ID (cached, so usually no round-trip)
+            template_id, questions_by_id = get_template_meta(template_name)
             
-            # Get template ID
-            cur.execute("""
-                SELECT id, questions FROM templates WHERE template_name = %s
-            """, (template_name,))
-            template_result = cur.fetchone()
-            if not template_result:
-                raise Exception(f"Template '{template_name}' not found")
-            template_id = template_result[0]
-            template_questions = template_result[1]
-            
-            # Get previous submission ID if updating
-            previous_submission_id = None
-            if is_update:
+            with conn.cursor() as cur:
+                # Upsert customer and partner, look up the previous submission
+                # if updating, and create the new submission in one round-trip
                 cur.execute("""
-                    SELECT MAX(s.id) as id
-                    FROM submissions s
-                    JOIN partners p ON s.partner_id = p.id
-                    WHERE s.customer_id = %s 
-                    AND p.partner_name = %s 
-                    AND p.partner_company = %s 
-                    AND s.template_id = %s
-                """, (customer_id, partner_name, partner_company, template_id))
-                prev_result = cur.fetchone()
-                if prev_result and prev_result[0]:
-                    previous_submission_id = prev_result[0]
-            
-            # Create new submission
-            cur.execute("""
-                INSERT INTO submissions (customer_id, partner_id, template_id, is_update, previous_submission_id) 
-                VALUES (%s, %s, %s, %s, %s) 
-                RETURNING id, submission_uuid
-            """, (customer_id, partner_id, template_id, is_update, previous_submission_id))
-            submission_result = cur.fetchone()
-            submission_id = submission_result[0]
-            submission_uuid = submission_result[1]
-            
-            # Insert responses
-            for question_id, response_value in responses.items():
-                if response_value is not None and response_value != '':
-                    # Find question details from template
-                    question_detail = next((q for q in template_questions if q['id'] == question_id), None)
-                    question_text = question_detail['question'] if question_detail else question_id
-                    response_type = question_detail['type'] if question_detail else 'unknown'
-                    section_name = question_detail.get('section') if question_detail else None
-                    
-                    cur.execute("""
-                        INSERT INTO responses (submission_id, question_id, question_text, response_value, response_type, section_name) 
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (submission_id, question_id, question_text, str(response_value), response_type, section_name))
+                    WITH c AS (
+                        INSERT INTO customers (customer_id, customer_company) 
+                        VALUES (%s, %s) 
+                        ON CONFLICT (customer_id) DO UPDATE SET customer_company = EXCLUDED.customer_company 
+                        RETURNING customer_id
+                    ),
+                    p AS (
+                        INSERT INTO partners (partner_name, partner_company) 
+                        VALUES (%s, %s) 
+                        ON CONFLICT (partner_name, partner_company) DO UPDATE SET partner_name = EXCLUDED.partner_name 
+                        RETURNING id
+                    ),
+                    prev AS (
+                        SELECT MAX(s.id) as id
+                        FROM submissions s
+                        JOIN partners p2 ON s.partner_id = p2.id
+                        WHERE %s
+                        AND s.customer_id = %s 
+                        AND p2.partner_name = %s 
+                        AND p2.partner_company = %s 
+                        AND s.template_id = %s
+                    )
+                    INSERT INTO submissions (customer_id, partner_id, template_id, is_update, previous_submission_id) 
+                    SELECT (SELECT customer_id FROM c), (SELECT id FROM p), %s, %s, (SELECT id FROM prev)
+                    RETURNING id, submission_uuid
+                """, (customer_id, customer_company,
+                      partner_name, partner_company,
+                      is_update, customer_id, partner_name, partner_company, template_id,
+                      template_id, is_update))
+                submission_result = cur.fetchone()
+                submission_id = submission_result[0]
+                submission_uuid = submission_result[1]
+                
+                # Bulk-load responses with COPY instead of INSERT
+                rows = []
+                for question_id, response_value in responses.items():
+                    if response_value is not None and response_value != '':
+                        question_detail = questions_by_id.get(str(question_id))
+                        question_text = question_detail['question'] if question_detail else question_id
+                        response_type = question_detail['type'] if question_detail else 'unknown'
+                        section_name = question_detail.get('section') if question_detail else None
+                        rows.append((submission_id, question_id, question_text, str(response_value), response_type, section_name))
+                
+                if rows:
+                    copy_buffer = io.StringIO(''.join('\t'.join(_copy_field(value) for value in row) + '\n' for row in rows))
+                    cur.copy_expert("""
+                        COPY responses (submission_id, question_id, question_text, response_value, response_type, section_name) 
+                        FROM STDIN
+                    """, copy_buffer)
+                
+                conn.commit()
             
-            conn.commit()
+            # Submissions never change templates, so the survey caches stay warm
+            clear_submission_caches()
             return {'success': True, 'submission_id': submission_id, 'submission_uuid': str(submission_uuid)}
     
     except Exception as e:
-        conn.rollback()
         st.error(f"Error submitting responses: {str(e)}")
         return {'success': False, 'error': str(e)}
 
 def upload_template(survey_name: str, questions: List[Dict], description: str = ""):
     """Upload a new survey template"""
+    # Skip the row rewrite when an identical template is re-uploaded;
+    # comparing as jsonb ignores formatting differences in the JSON text
     query = """
         INSERT INTO templates (template_name, questions, description) 
-        VALUES (%s, %s, %s) 
+        VALUES (%s, %s::jsonb, %s) 
         ON CONFLICT (template_name) 
-        DO UPDATE SET questions = %s, updated_date = CURRENT_TIMESTAMP
+        DO UPDATE SET questions = EXCLUDED.questions, description = EXCLUDED.description, 
+                      updated_date = CURRENT_TIMESTAMP
+        WHERE templates.questions IS DISTINCT FROM EXCLUDED.questions 
+           OR templates.description IS DISTINCT FROM EXCLUDED.description
         RETURNING id
     """
-    questions_json = json.dumps(questions)
-    result = execute_query(query, (survey_name, questions_json, description, questions_json), fetch=True)
-    return result is not None
+    questions_json = orjson.dumps(questions).decode()
+    result = execute_query(query, (survey_name, questions_json, description), fetch=True)
+    if result is None:
+        return False
+    get_template_meta.clear()
+    clear_cache()
+    return True
+
+# Rows fetched per round-trip by the export's server-side cursor
+EXPORT_FETCH_SIZE = 10000
+
+def _excel_row(row):
+    """Drop tzinfo from datetimes, which openpyxl refuses to write (timestamptz columns)"""
+    return [value.replace(tzinfo=None) if isinstance(value, datetime) and value.tzinfo else value
+            for value in row]
 
 def export_all_submissions():
     """Export all submissions to Excel"""
-    query = """
+    # Aggregate the summary in PostgreSQL rather than grouping in pandas
+    summary_query = """
         SELECT 
             s.submission_uuid,
             s.submission_date,
@@ -306,44 +406,78 @@ def export_all_submissions():
             p.partner_company,
             t.template_name as survey_name,
             s.is_update,
+            COUNT(*) as response_count
+        FROM submissions s
+        JOIN customers c ON s.customer_id = c.customer_id
+        JOIN partners p ON s.partner_id = p.id
+        JOIN templates t ON s.template_id = t.id
+        LEFT JOIN responses r ON s.id = r.submission_id
+        GROUP BY s.submission_uuid, s.submission_date, s.customer_id, c.customer_company,
+                 p.partner_name, p.partner_company, t.template_name, s.is_update
+        ORDER BY s.submission_uuid
+    """
+    detailed_columns = ['submission_uuid', 'submission_date', 'customer_id', 'customer_company', 
+                        'partner_name', 'partner_company', 'survey_name', 'section_name', 
+                        'question_id', 'question_text', 'response_value', 'response_type']
+    detailed_query = """
+        SELECT 
+            s.submission_uuid,
+            s.submission_date,
+            s.customer_id,
+            c.customer_company,
+            p.partner_name,
+            p.partner_company,
+            t.template_name as survey_name,
+            r.section_name,
             r.question_id,
             r.question_text,
             r.response_value,
-            r.response_type,
-            r.section_name
+            r.response_type
         FROM submissions s
         JOIN customers c ON s.customer_id = c.customer_id
         JOIN partners p ON s.partner_id = p.id
         JOIN templates t ON s.template_id = t.id
-        LEFT JOIN responses r ON s.id = r.submission_id
+        JOIN responses r ON s.id = r.submission_id
+        WHERE r.response_value IS NOT NULL
         ORDER BY s.submission_date DESC, r.question_id
     """
-    results = execute_query(query)
-    
-    if not results:
+    try:
+        with borrow() as conn:
+            if not conn:
+                return None
+            
+            with conn.cursor() as cur:
+                cur.execute(summary_query)
+                summary_rows = cur.fetchall()
+                summary_columns = [d.name for d in cur.description]
+            
+            if not summary_rows:
+                conn.commit()
+                return None
+            
+            # Write-only mode streams rows to the file instead of holding the sheet in memory
+            workbook = Workbook(write_only=True)
+            
+            summary_sheet = workbook.create_sheet('Summary')
+            summary_sheet.append(summary_columns)
+            for row in summary_rows:
+                summary_sheet.append(_excel_row(row))
+            
+            detailed_sheet = workbook.create_sheet('Detailed Responses')
+            detailed_sheet.append(detailed_columns)
+            # Named (server-side) cursor fetches detail rows in batches
+            with conn.cursor(name='export_cur') as cur:
+                cur.itersize = EXPORT_FETCH_SIZE
+                cur.execute(detailed_query)
+                for row in cur:
+                    detailed_sheet.append(_excel_row(row))
+            conn.commit()
+    except Exception as e:
+        st.error(f"Database error: {str(e)}")
         return None
     
-    # Create DataFrame
-    df = pd.DataFrame(results)
-    
-    # Create Excel file with multiple sheets
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Summary sheet
-        summary_df = df.groupby(['submission_uuid', 'submission_date', 'customer_id', 
-                                 'customer_company', 'partner_name', 'partner_company', 
-                                 'survey_name', 'is_update']).size().reset_index(name='response_count')
-        summary_df.to_excel(writer, sheet_name='Summary', index=False)
-        
-        # Detailed responses sheet
-        detailed_df = df[df['response_value'].notna()][['submission_uuid', 'submission_date', 
-                                                          'customer_id', 'customer_company', 
-                                                          'partner_name', 'partner_company', 
-                                                          'survey_name', 'section_name', 
-                                                          'question_id', 'question_text', 
-                                                          'response_value', 'response_type']]
-        detailed_df.to_excel(writer, sheet_name='Detailed Responses', index=False)
-    
+    workbook.save(output)
     output.seek(0)
     return output
 
@@ -351,6 +485,19 @@ def export_all_submissions():
 # FILE PARSING UTILITIES
 # ============================================================================
 
+def _split_column(values: pd.Series, separators: List[str]) -> List[List[str]]:
+    """Split each cell on the first separator it contains, dropping blank parts"""
+    text = values.where(values.notna(), '').map(str)
+    if text.empty:
+        return []
+    sep = pd.Series(separators[-1], index=text.index)
+    for candidate in reversed(separators[:-1]):
+        sep = sep.mask(text.str.contains(candidate, regex=False), candidate)
+    # One vectorized split per separator actually used in the file
+    parts = pd.concat([text[sep == candidate].str.split(candidate, regex=False)
+                       for candidate in sep.unique()]).reindex(text.index)
+    return [[part.strip() for part in cell if part.strip()] for cell in parts]
+
 def parse_survey_file(uploaded_file):
     """Parse Excel or CSV file to extract survey questions"""
     try:
@@ -363,61 +510,57 @@ def parse_survey_file(uploaded_file):
             st.error("Unsupported file format. Please upload .xlsx, .xls, or .csv file.")
             return None
         
+        n = len(df)
+        
+        def column(name, default):
+            return df[name] if name in df.columns else pd.Series([default] * n, index=df.index, dtype=object)
+        
+        # Convert each column once instead of boxing every row as a Series
+        ids = df['QuestionID'].tolist() if 'QuestionID' in df.columns else [f'Q{i+1}' for i in range(n)]
+        types = column('Type', 'text').map(str).str.lower().tolist()
+        texts = column('Question', '').map(str).tolist()
+        sections = column('Section', '').map(str).tolist()
+        required = column('Required', 'No').map(str).isin(['Yes', 'TRUE', 'True', 'yes', 'true']).tolist()
+        # Try different separators for options: pipe, semicolon, comma
+        options = _split_column(column('Options', ''), ['|', ';', ','])
+        matrix_rows = _split_column(column('MatrixRows', ''), ['|', ','])
+        matrix_cols = _split_column(column('MatrixCols', ''), ['|', ','])
+        min_ratings = column('MinRating', 1).tolist()
+        max_ratings = column('MaxRating', 5).tolist()
+        depends_on = column('DependsOn', None)
+        depends_on_value = column('DependsOnValue', None)
+        has_depends_on = depends_on.notna().tolist()
+        has_depends_on_value = depends_on_value.notna().tolist()
+        depends_on = depends_on.map(str).tolist()
+        depends_on_value = depends_on_value.map(str).tolist()
+        
         questions = []
-        for idx, row in df.iterrows():
+        for i in range(n):
             question = {
-                'id': row.get('QuestionID', f'Q{idx+1}'),
-                'type': str(row.get('Type', 'text')).lower(),
-                'question': str(row.get('Question', '')),
-                'section': str(row.get('Section', '')),
-                'required': str(row.get('Required', 'No')) in ['Yes', 'TRUE', 'True', 'yes', 'true']
+                'id': ids[i],
+                'type': types[i],
+                'question': texts[i],
+                'section': sections[i],
+                'required': required[i]
             }
             
             # Handle question-specific fields
             if question['type'] in ['multiple_choice', 'multiple_choice_single_select', 'multiple_choice_multi_select']:
-                options = row.get('Options', '')
-                if pd.notna(options) and str(options).strip():
-                    # Try different separators: comma, pipe, semicolon
-                    options_str = str(options)
-                    if '|' in options_str:
-                        question['options'] = [opt.strip() for opt in options_str.split('|') if opt.strip()]
-                    elif ';' in options_str:
-                        question['options'] = [opt.strip() for opt in options_str.split(';') if opt.strip()]
-                    else:
-                        question['options'] = [opt.strip() for opt in options_str.split(',') if opt.strip()]
-                else:
-                    question['options'] = []
+                question['options'] = options[i]
             
             elif question['type'] == 'rating':
-                question['minRating'] = int(row.get('MinRating', 1))
-                question['maxRating'] = int(row.get('MaxRating', 5))
+                question['minRating'] = int(min_ratings[i])
+                question['maxRating'] = int(max_ratings[i])
             
             elif question['type'] == 'matrix':
-                matrix_rows = row.get('MatrixRows', '')
-                matrix_cols = row.get('MatrixCols', '')
-                if pd.notna(matrix_rows) and str(matrix_rows).strip():
-                    rows_str = str(matrix_rows)
-                    if '|' in rows_str:
-                        question['matrixRows'] = [r.strip() for r in rows_str.split('|') if r.strip()]
-                    else:
-                        question['matrixRows'] = [r.strip() for r in rows_str.split(',') if r.strip()]
-                else:
-                    question['matrixRows'] = []
-                    
-                if pd.notna(matrix_cols) and str(matrix_cols).strip():
-                    cols_str = str(matrix_cols)
-                    if '|' in cols_str:
-                        question['matrixCols'] = [c.strip() for c in cols_str.split('|') if c.strip()]
-                    else:
-                        question['matrixCols'] = [c.strip() for c in cols_str.split(',') if c.strip()]
-                else:
-                    question['matrixCols'] = []
+                question['matrixRows'] = matrix_rows[i]
+                question['matrixCols'] = matrix_cols[i]
             
             # Handle dependencies
-            if pd.notna(row.get('DependsOn')):
-                question['dependsOn'] = str(row['DependsOn'])
-                if pd.notna(row.get('DependsOnValue')):
-                    question['dependsOnValue'] = str(row['DependsOnValue'])
+            if has_depends_on[i]:
+                question['dependsOn'] = depends_on[i]
+                if has_depends_on_value[i]:
+                    question['dependsOnValue'] = depends_on_value[i]
             
             questions.append(question)
         
@@ -489,7 +632,7 @@ def render_question(question: Dict, key_prefix: str = ""):
         return st.slider(label, min_value=min_rating, max_value=max_rating, value=value, key=key)
     
     elif q_type == 'matrix':
-        st.write(label)
+        st.markdown(f'<div class="matrix-label">{label}</div>', unsafe_allow_html=True)
         matrix_rows = question.get('matrixRows', [])
         matrix_cols = question.get('matrixCols', [])
         
@@ -503,60 +646,18 @@ def render_question(question: Dict, key_prefix: str = ""):
         existing_matrix = {}
         if existing_value:
             try:
-                existing_matrix = json.loads(existing_value)
+                existing_matrix = orjson.loads(existing_value)
             except:
                 pass
         
         # Create matrix table using columns
         matrix_responses = {}
         
-        # Create a container for better styling
-        st.markdown("---")
-        
-        # Add custom CSS to hide radio button text and style the matrix
-        st.markdown("""
-        <style>
-        /* Hide the radio button labels since we have headers */
-        div[data-testid="stRadio"] label[data-baseweb="radio"] > div:last-child {
-            display: none !important;
-        }
-        /* Style the matrix container */
-        .matrix-table-container {
-            border: 1px solid #e0e0e0;
-            border-radius: 4px;
-            margin: 10px 0;
-        }
-        /* Center align radio buttons */
-        div[data-testid="stRadio"] {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        }
-        /* Reduce padding around radio buttons */
-        div[data-testid="stRadio"] > div {
-            gap: 0 !important;
-        }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Create a clean table structure
-        st.markdown('<div class="matrix-table-container">', unsafe_allow_html=True)
-        
-        # Calculate column widths to match radio button spacing
-        # First column for aspect names, rest divided equally for radio buttons
+        # First column for aspect names, second for the row's horizontal radio group
         num_options = len(matrix_cols)
-        col_widths = [2] + [1] * num_options
-        
-        # Header row
-        header_cols = st.columns(col_widths)
-        with header_cols[0]:
-            st.markdown('<div style="padding: 8px 12px; font-weight: bold; background-color: #f8f9fa; border-bottom: 2px solid #d0d0d0;">Aspect</div>', unsafe_allow_html=True)
+        col_widths = [2, num_options]
         
-        for idx, col_name in enumerate(matrix_cols):
-            with header_cols[idx + 1]:
-                st.markdown(f'<div style="padding: 8px; font-weight: bold; background-color: #f8f9fa; border-bottom: 2px solid #d0d0d0; text-align: center;">{col_name}</div>', unsafe_allow_html=True)
-        
-        # Data rows with radio buttons
+        # Data rows, one radio group per row
         for row_idx, row_name in enumerate(matrix_rows):
             # Get existing value for this row
             existing_row_value = existing_matrix.get(row_name, None)
@@ -574,47 +675,51 @@ def render_question(question: Dict, key_prefix: str = ""):
             # Create a unique key for this row's radio group
             row_key = f"{key}_{row_name.replace(' ', '_').replace('|', '_')}_{row_idx}"
             
-            # Place each radio button in its corresponding column
-            for col_idx, col_name in enumerate(matrix_cols):
-                with row_cols[col_idx + 1]:
-                    # Create a container with border and centered content
-                    st.markdown(f'<div style="padding: 4px; border-bottom: 1px solid #e0e0e0; text-align: center; display: flex; align-items: center; justify-content: center;">', unsafe_allow_html=True)
-                    
-                    # Single radio button for this cell
-                    is_selected = (existing_row_value == col_name)
-                    cell_key = f"{row_key}_{col_idx}"
-                    
-                    if st.radio(
-                        label=col_name,
-                        options=[col_name],
-                        index=0 if is_selected else None,
-                        key=cell_key,
-                        label_visibility="collapsed"
-                    ):
-                        matrix_responses[row_name] = col_name
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
+            with row_cols[1]:
+                choice = st.radio(
+                    label=row_name,
+                    options=matrix_cols,
+                    index=selected_idx,
+                    key=row_key,
+                    horizontal=True,
+                    label_visibility="collapsed"
+                )
+                if choice:
+                    matrix_responses[row_name] = choice
         
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        st.markdown("---")
-        
-        return json.dumps(matrix_responses) if matrix_responses else ""
+        return orjson.dumps(matrix_responses).decode() if matrix_responses else ""
     
     else:  # default to text
         return st.text_input(label, value=existing_value, key=key)
 
+def get_survey_sections(survey_config: Dict) -> Dict[str, List[Dict]]:
+    """Group a survey's questions by section, once per template version per session"""
+    cache_key = f"sections_{survey_config['survey_name']}"
+    cached = st.session_state.get(cache_key)
+    if cached is None or cached[0] != survey_config['updated_date']:
+        sections = {}
+        for q in survey_config['questions']:
+            section = q.get('section', 'General')
+            if section not in sections:
+                sections[section] = []
+            sections[section].append(q)
+        cached = (survey_config['updated_date'], sections)
+        st.session_state[cache_key] = cached
+    return cached[1]
+
 def render_survey_form(survey_config: Dict):
-    """Render complete survey form"""
-    questions = survey_config['questions']
+    """Render survey questions and return the ones shown plus how many are answered
     
-    # Group questions by section
-    sections = {}
-    for q in questions:
-        section = q.get('section', 'General')
-        if section not in sections:
-            sections[section] = []
-        sections[section].append(q)
+    Meant to be called inside an st.form, so answers are only sent (and
+    dependent questions re-evaluated) when the form is submitted.
+    """
+    sections = get_survey_sections(survey_config)
+    
+    # Visibility and answered state are tallied once per question while
+    # rendering, so a dependent question reacts to its parent's value in the
+    # same rerun and progress needs no second pass
+    visible_questions = []
+    answered_count = 0
     
     # Render sections
     for section_name, section_questions in sections.items():
@@ -622,14 +727,16 @@ def render_survey_form(survey_config: Dict):
         
         for question in section_questions:
             if should_show_question(question, st.session_state.survey_responses):
+                visible_questions.append(question)
                 response = render_question(question, key_prefix=f"survey_{section_name}")
                 st.session_state.survey_responses[question['id']] = response
+                if response:
+                    answered_count += 1
     
-    # Progress indicator
-    total_questions = len([q for q in questions if should_show_question(q, st.session_state.survey_responses)])
-    answered_questions = len([q for q in questions if should_show_question(q, st.session_state.survey_responses) 
-                              and st.session_state.survey_responses.get(q['id'])])
-    
+    return visible_questions, answered_count
+
+def render_progress(answered_questions: int, total_questions: int):
+    """Render progress indicator"""
     if total_questions > 0:
         progress = answered_questions / total_questions
         st.progress(progress)
@@ -763,7 +870,12 @@ def render_partner_mode():
     st.subheader("2️⃣ Select Customer")
     search_term = st.text_input("🔍 Search Customer", placeholder="Search by company name or ID")
     
-    customers = get_customers(search_term)
+    # Query only when the search term changes; reruns from other widgets reuse the last result
+    search_term = search_term.strip()
+    if st.session_state.get('customer_search') != search_term or 'customer_results' not in st.session_state:
+        st.session_state.customer_search = search_term
+        st.session_state.customer_results = get_customers(search_term)
+    customers = st.session_state.customer_results
     if customers:
         customer_options = {f"{c['customer_company']} ({c['customer_id']})": c for c in customers}
         selected_customer_key = st.selectbox(
@@ -830,55 +942,65 @@ def render_partner_mode():
         st.markdown("---")
         st.subheader("4️⃣ Complete Survey")
         
-        render_survey_form(st.session_state.selected_survey)
+        survey = st.session_state.selected_survey
         
-        # Submit button
-        st.markdown("---")
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("📤 Submit Survey", type="primary", use_container_width=True):
-                # Validate required fields
-                questions = st.session_state.selected_survey['questions']
-                missing_required = []
-                
-                for q in questions:
-                    if q.get('required') and should_show_question(q, st.session_state.survey_responses):
-                        if not st.session_state.survey_responses.get(q['id']):
-                            missing_required.append(q['question'])
+        # Batch all answers into one rerun on submit instead of one per widget change
+        with st.form(key=f"survey_form_{survey['survey_name']}", clear_on_submit=False):
+            visible_questions, answered_count = render_survey_form(survey)
+            
+            if any('dependsOn' in q for q in survey['questions']):
+                st.caption("ℹ️ Follow-up questions based on your answers appear after you submit.")
+            
+            # Submit button
+            st.markdown("---")
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col2:
+                submitted = st.form_submit_button("📤 Submit Survey", type="primary", use_container_width=True)
+        
+        # Widgets inside a form don't update mid-form, so progress lives outside it
+        render_progress(answered_count, len(visible_questions))
+        
+        if submitted:
+            # Validate required fields
+            missing_required = []
+            
+            for q in visible_questions:
+                if q.get('required') and not st.session_state.survey_responses.get(q['id']):
+                    missing_required.append(q['question'])
+            
+            if missing_required:
+                st.error(f"❌ Please answer all required questions. Missing: {', '.join(missing_required[:3])}")
+            else:
+                # Submit responses
+                result = submit_survey_responses(
+                    customer_id=st.session_state.selected_customer['customer_id'],
+                    customer_company=st.session_state.selected_customer['customer_company'],
+                    partner_name=partner_name,
+                    partner_company=partner_company,
+                    template_name=survey['survey_name'],
+                    responses=st.session_state.survey_responses,
+                    is_update=st.session_state.get('is_update', False)
+                )
                 
-                if missing_required:
-                    st.error(f"❌ Please answer all required questions. Missing: {', '.join(missing_required[:3])}")
-                else:
-                    # Submit responses
-                    result = submit_survey_responses(
-                        customer_id=st.session_state.selected_customer['customer_id'],
-                        customer_company=st.session_state.selected_customer['customer_company'],
-                        partner_name=partner_name,
-                        partner_company=partner_company,
-                        template_name=st.session_state.selected_survey['survey_name'],
-                        responses=st.session_state.survey_responses,
-                        is_update=st.session_state.get('is_update', False)
-                    )
-                    
-                    if result and result.get('success'):
-                        st.success(f"""
-                            ✅ **Survey Submitted Successfully!**
-                            
-                            Submission ID: {result['submission_uuid']}
-                            
-                            Thank you for completing the survey!
-                        """)
-                        st.balloons()
+                if result and result.get('success'):
+                    st.success(f"""
+                        ✅ **Survey Submitted Successfully!**
                         
-                        # Reset form
-                        if st.button("Start New Survey"):
-                            st.session_state.survey_responses = {}
-                            st.session_state.selected_customer = None
-                            st.session_state.selected_survey = None
-                            st.session_state.existing_responses_checked = False
-                            st.rerun()
-                    else:
-                        st.error(f"❌ Failed to submit survey: {result.get('error', 'Unknown error')}")
+                        Submission ID: {result['submission_uuid']}
+                        
+                        Thank you for completing the survey!
+                    """)
+                    st.balloons()
+                    
+                    # Reset form
+                    if st.button("Start New Survey"):
+                        st.session_state.survey_responses = {}
+                        st.session_state.selected_customer = None
+                        st.session_state.selected_survey = None
+                        st.session_state.existing_responses_checked = False
+                        st.rerun()
+                else:
+                    st.error(f"❌ Failed to submit survey: {result.get('error', 'Unknown error')}")
     
     elif not (partner_name and partner_company):
         st.info("👆 Please enter your partner information to continue")
@@ -904,14 +1026,19 @@ def main():
     st.sidebar.title("🔧 Navigation")
     
     # Connection status
-    conn = get_db_connection()
-    if conn:
+    pool = get_pool()
+    if pool:
         st.sidebar.success("✅ Database Connected")
     else:
         st.sidebar.error("❌ Database Connection Failed")
         st.error("Please configure database credentials in Streamlit secrets")
         return
     
+    # Migrations only add optional indexes, so the app keeps working without them
+    migration_error = apply_schema_migrations()
+    if migration_error:
+        st.sidebar.warning(f"⚠️ Schema migrations not fully applied: {migration_error}")
+    
     # Mode selection
     mode = st.sidebar.radio(
         "Select Mode:",
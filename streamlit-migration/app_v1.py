@@ -1,10 +1,15 @@
 import streamlit as st
 from helper import postgres_fetch, postgres_insert, postgres_update, postgres_delete
 import pandas as pd
-import json
-from datetime import datetime
+import xlsxwriter
+import re
+import orjson
+from datetime import datetime, date, time, timedelta
+from decimal import Decimal
 import io
-from typing import Dict, List, Any
+import os
+import zipfile
+from typing import Dict, List, Any, Tuple
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -19,51 +24,14 @@ st.set_page_config(
 # ============================================================================
 # CUSTOM CSS - BROADCOM INSPIRED STYLING
 # ============================================================================
-st.markdown("""
-    <style>
-    .main-header {
-        background: linear-gradient(135deg, #0066CC 0%, #004499 100%);
-        color: white;
-        padding: 2rem;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-        text-align: center;
-    }
-    .stButton>button {
-        background-color: #0066CC;
-        color: white;
-        border-radius: 5px;
-        padding: 0.5rem 2rem;
-        border: none;
-        font-weight: 600;
-    }
-    .stButton>button:hover {
-        background-color: #004499;
-    }
-    .success-box {
-        background-color: #d4edda;
-        border: 1px solid #c3e6cb;
-        border-radius: 5px;
-        padding: 1rem;
-        margin: 1rem 0;
-    }
-    .warning-box {
-        background-color: #fff3cd;
-        border: 1px solid #ffeaa7;
-        border-radius: 5px;
-        padding: 1rem;
-        margin: 1rem 0;
-    }
-    .section-header {
-        background-color: #f1f5f9;
-        padding: 1rem;
-        border-radius: 5px;
-        margin: 1rem 0;
-        font-weight: 600;
-        color: #0066CC;
-    }
-    </style>
-""", unsafe_allow_html=True)
+@st.cache_resource(show_spinner=False)
+def load_css() -> str:
+    """Read the shared stylesheet once per process"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css"), encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+# Injected on every run: Streamlit drops elements that a rerun doesn't re-emit
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # ============================================================================
 # SQL HELPER FUNCTIONS
@@ -81,31 +49,38 @@ def escape_sql_string(value):
     escaped = str(value).replace("'", "''")
     return f"'{escaped}'"
 
-def format_sql_query(query: str, params: tuple = None):
-    """Format SQL query with parameters safely"""
-    if params is None:
-        return query
-    
-    formatted_query = query
-    for param in params:
-        escaped_value = escape_sql_string(param)
-        # Replace first %s with escaped value
-        formatted_query = formatted_query.replace('%s', escaped_value, 1)
-    
-    return formatted_query
+def _text_literal(value):
+    """Render a value as an escaped, explicitly typed text literal"""
+    # Multi-row VALUES lists infer column types from every row, so a template mixing
+    # numeric and text question IDs would otherwise fail type resolution
+    return f"{escape_sql_string(str(value))}::text"
 
 # ============================================================================
 # DATABASE OPERATIONS
 # ============================================================================
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
+def _load_questions(raw) -> List[Dict]:
+    """Decode a template's questions (native jsonb list or JSON text) into a list"""
+    if isinstance(raw, str):
+        raw = orjson.loads(raw)
+    return raw if isinstance(raw, list) else []
+
+def _survey_questions(raw, survey_name: str) -> List[Dict]:
+    """Decode one survey's questions, warning (and returning []) on malformed JSON"""
+    try:
+        return _load_questions(raw)
+    except orjson.JSONDecodeError as e:
+        st.warning(f"Failed to parse questions JSON for {survey_name}: {str(e)}")
+        return []
+
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)  # Cache for 5 minutes
 def get_all_surveys():
     """Fetch all available surveys"""
     query = """
         SELECT 
             "template_name" as survey_name,
             "description",
-            "questions"::text as questions,
+            "questions",
             "created_date",
             "updated_date"
         FROM "templates" 
@@ -119,50 +94,80 @@ def get_all_surveys():
             return []
         if df is None or df.empty:
             return []
-        # Convert DataFrame to list of dictionaries
-        records = df.to_dict('records')
-        # Parse questions JSON field and clean up NaN values
-        for record in records:
-            # Clean up NaN values in description
-            if 'description' in record:
-                desc = record['description']
-                if desc is None or (isinstance(desc, float) and pd.isna(desc)):
-                    record['description'] = ''
-            if 'questions' in record:
-                questions = record['questions']
-                # Handle different data types
-                if questions is None:
-                    record['questions'] = []
-                elif isinstance(questions, str):
-                    # Try to parse as JSON string
-                    try:
-                        parsed = json.loads(questions)
-                        record['questions'] = parsed if isinstance(parsed, list) else []
-                    except (json.JSONDecodeError, TypeError) as e:
-                        # If parsing fails, set to empty list
-                        st.warning(f"Failed to parse questions JSON for {record.get('survey_name', 'Unknown')}: {str(e)}")
-                        record['questions'] = []
-                elif isinstance(questions, (list, dict)):
-                    # Already parsed or is a list/dict
-                    record['questions'] = questions if isinstance(questions, list) else []
-                else:
-                    # Try to convert to string and parse
-                    try:
-                        questions_str = str(questions)
-                        parsed = json.loads(questions_str)
-                        record['questions'] = parsed if isinstance(parsed, list) else []
-                    except (json.JSONDecodeError, TypeError):
-                        record['questions'] = []
-        return records
+        # Clean up NaN descriptions and parse questions column-wise, then convert once
+        df['description'] = df['description'].fillna('')
+        df['questions'] = pd.Series([_survey_questions(raw, name) for raw, name in zip(df['questions'], df['survey_name'])],
+                                    index=df.index, dtype=object)
+        return df.to_dict('records')
     except Exception as e:
         st.error(f"Database error in get_all_surveys: {str(e)}")
         import traceback
         st.error(traceback.format_exc())
         return []
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_customers(search_term: str = ""):
-    """Search customers by company name or ID"""
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)  # Cache for 5 minutes
+def list_surveys():
+    """Fetch survey metadata and question counts without the questions payload"""
+    query = """
+        SELECT 
+            "template_name" as survey_name,
+            "description",
+            CASE WHEN jsonb_typeof("questions") = 'array' THEN jsonb_array_length("questions") ELSE 0 END as question_count,
+            "created_date",
+            "updated_date"
+        FROM "templates" 
+        ORDER BY "created_date" DESC
+    """
+    try:
+        df = postgres_fetch(query)
+        # Check if result is actually a DataFrame
+        if not isinstance(df, pd.DataFrame):
+            st.error(f"Unexpected return type from postgres_fetch: {type(df)}")
+            return []
+        if df is None or df.empty:
+            return []
+        df['description'] = df['description'].fillna('')
+        return df.to_dict('records')
+    except Exception as e:
+        st.error(f"Database error in list_surveys: {str(e)}")
+        return []
+
+@st.cache_data(ttl=300, max_entries=64, show_spinner=False)  # Cache for 5 minutes
+def get_survey_questions_df(survey_name: str, updated_date=None):
+    """Fetch a survey's questions as a display table, shaped by PostgreSQL"""
+    # updated_date only keys the cache, so an edited template never serves a stale table
+    query = f"""
+        SELECT 
+            x."q"->>'id' as "ID",
+            x."q"->>'type' as "Type",
+            x."q"->>'question' as "Question",
+            COALESCE(x."q"->>'section', '') as "Section",
+            -- Compared as text so a non-boolean "required" from another client can't fail the query
+            COALESCE(lower(x."q"->>'required') IN ('true', 't', 'yes', 'y', '1'), FALSE) as "Required"
+        FROM "templates" t
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(t."questions") = 'array' THEN t."questions" ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS x("q", "position")
+        WHERE t."template_name" = {escape_sql_string(survey_name)}
+        ORDER BY x."position"
+    """
+    try:
+        df = postgres_fetch(query)
+        if not isinstance(df, pd.DataFrame) or df is None:
+            return pd.DataFrame(columns=['ID', 'Type', 'Question', 'Section', 'Required'])
+        return df
+    except Exception as e:
+        st.error(f"Database error in get_survey_questions_df: {str(e)}")
+        return pd.DataFrame(columns=['ID', 'Type', 'Question', 'Section', 'Required'])
+
+# Searches of this length or shorter go straight to the database; longer ones are
+# filtered in memory from the cached candidates for their first few characters
+CUSTOMER_PREFIX_LENGTH = 3
+CUSTOMER_PREFIX_LIMIT = 500
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)  # Cache per fragment for 5 minutes
+def _search_customers(search_term: str, limit: int):
+    """Fetch customers whose company name or ID contains search_term"""
     try:
         if search_term:
             search_pattern = f"%{search_term}%"
@@ -172,14 +177,14 @@ def get_customers(search_term: str = ""):
                 WHERE "customer_company" ILIKE {escape_sql_string(search_pattern)} 
                    OR "customer_id" ILIKE {escape_sql_string(search_pattern)}
                 ORDER BY "customer_company" ASC
-                LIMIT 50
+                LIMIT {int(limit)}
             """
         else:
-            query = """
+            query = f"""
                 SELECT "customer_id", "customer_company", "classification", "owner"
                 FROM "customers" 
                 ORDER BY "customer_company" ASC
-                LIMIT 50
+                LIMIT {int(limit)}
             """
         
         df = postgres_fetch(query)
@@ -193,34 +198,118 @@ def get_customers(search_term: str = ""):
         st.error(f"Database error: {str(e)}")
         return []
 
+def get_customers(search_term: str = ""):
+    """Search customers by company name or ID"""
+    # ILIKE is case-insensitive, so normalize the term to share cache entries
+    term = search_term.strip().lower()
+    if len(term) <= CUSTOMER_PREFIX_LENGTH:
+        return _search_customers(term, 50)
+    
+    # Every match for the full term also contains its first few characters
+    candidates = _search_customers(term[:CUSTOMER_PREFIX_LENGTH], CUSTOMER_PREFIX_LIMIT + 1)
+    if len(candidates) > CUSTOMER_PREFIX_LIMIT:
+        # Too many candidates to be sure the in-memory filter sees every match
+        return _search_customers(term, 50)
+    
+    def matches(value):
+        return isinstance(value, str) and term in value.lower()
+    
+    return [c for c in candidates if matches(c['customer_company']) or matches(c['customer_id'])][:50]
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)  # Cache for 1 minute
+def get_customer_options(search_term: str = "") -> Dict[str, Dict]:
+    """Map customer selectbox labels to customer records for a search term"""
+    return {f"{c['customer_company']} ({c['customer_id']})": c for c in get_customers(search_term)}
+
+@st.cache_data(ttl=300, show_spinner=False)  # Cache for 5 minutes
+def get_template_meta(template_name: str):
+    """Fetch a template's ID and its questions keyed by question ID"""
+    template_query = f"""
+        SELECT "id", "questions" FROM "templates" WHERE "template_name" = {escape_sql_string(template_name)}
+    """
+    template_df = postgres_fetch(template_query)
+    if not isinstance(template_df, pd.DataFrame) or template_df is None or template_df.empty:
+        raise Exception(f"Template '{template_name}' not found")
+    template_id = int(template_df.iloc[0]['id'])
+    template_questions_raw = template_df.iloc[0]['questions']
+    try:
+        template_questions = _load_questions(template_questions_raw)
+    except orjson.JSONDecodeError:
+        raise Exception(f"Failed to parse questions JSON for template '{template_name}'")
+    
+    # Index questions by ID for O(1) lookups while building responses
+    questions_by_id = {q['id']: q for q in template_questions if isinstance(q, dict) and 'id' in q}
+    return template_id, questions_by_id
+
+@st.cache_data(ttl=60, max_entries=512, show_spinner=False)  # Cache for 1 minute
+def has_existing_submission(customer_id: str, partner_company: str, template_name: str) -> bool:
+    """Cheap existence check run before fetching a previous submission's responses"""
+    query = f"""
+        SELECT EXISTS (
+            SELECT 1
+            FROM "submissions" s
+            JOIN "partners" p ON s."partner_id" = p."id"
+            JOIN "templates" t ON s."template_id" = t."id"
+            WHERE s."customer_id"::text = {escape_sql_string(customer_id)} 
+            AND p."partner_company" = {escape_sql_string(partner_company)} 
+            AND t."template_name" = {escape_sql_string(template_name)}
+        ) as has_existing
+    """
+    try:
+        df = postgres_fetch(query)
+        if not isinstance(df, pd.DataFrame) or df is None or df.empty:
+            return False
+        return bool(df.iloc[0]['has_existing'])
+    except Exception:
+        # Same policy as check_existing_responses: treat lookup failures as "no previous response"
+        return False
+
+def _dump_response(value) -> str:
+    """Serialize a response value for storage; matrix answers are dicts in session state"""
+    if isinstance(value, dict):
+        return orjson.dumps(value).decode()
+    return str(value)
+
+def _load_response(value, response_type: str):
+    """Parse a stored response value back into its session-state form"""
+    if response_type == 'matrix' and isinstance(value, str) and value:
+        try:
+            parsed = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return value
+        return parsed if isinstance(parsed, dict) else value
+    return value
+
+@st.cache_data(ttl=60, max_entries=512, show_spinner=False)  # Cache for 1 minute
 def check_existing_responses(customer_id: str, partner_company: str, template_name: str):
     """Check if responses already exist for this combination"""
     try:
+        # Find the latest matching submission once, then join its responses
         # Ensure customer_id is treated as text for comparison
         query = f"""
+            WITH latest AS (
+                SELECT s."id"
+                FROM "submissions" s
+                JOIN "partners" p ON s."partner_id" = p."id"
+                JOIN "templates" t ON s."template_id" = t."id"
+                WHERE s."customer_id"::text = {escape_sql_string(customer_id)} 
+                AND p."partner_company" = {escape_sql_string(partner_company)} 
+                AND t."template_name" = {escape_sql_string(template_name)}
+                ORDER BY s."id" DESC
+                LIMIT 1
+            )
             SELECT 
                 r."question_id", 
                 r."response_value", 
+                r."response_type", 
                 s."submission_date",
                 p."partner_name" as previous_partner_name,
                 c."customer_company"
-            FROM "responses" r
-            JOIN "submissions" s ON r."submission_id" = s."id"
+            FROM latest
+            JOIN "submissions" s ON s."id" = latest."id"
             JOIN "partners" p ON s."partner_id" = p."id"
             JOIN "customers" c ON s."customer_id" = c."customer_id"
-            JOIN "templates" t ON s."template_id" = t."id"
-            WHERE s."customer_id"::text = {escape_sql_string(customer_id)} 
-            AND p."partner_company" = {escape_sql_string(partner_company)} 
-            AND t."template_name" = {escape_sql_string(template_name)}
-            AND s."id" = (
-                SELECT MAX(s2."id") 
-                FROM "submissions" s2 
-                JOIN "partners" p2 ON s2."partner_id" = p2."id"
-                JOIN "templates" t2 ON s2."template_id" = t2."id"
-                WHERE s2."customer_id"::text = {escape_sql_string(customer_id)}
-                AND p2."partner_company" = {escape_sql_string(partner_company)}
-                AND t2."template_name" = {escape_sql_string(template_name)}
-            )
+            JOIN "responses" r ON r."submission_id" = latest."id"
         """
         
         df = postgres_fetch(query)
@@ -237,7 +326,10 @@ def check_existing_responses(customer_id: str, partner_company: str, template_na
         if df is not None and not df.empty:
             # Convert DataFrame to list of dicts
             results = df.to_dict('records')
-            responses = {row['question_id']: row['response_value'] for row in results}
+            responses = {
+                row['question_id']: _load_response(row['response_value'], row['response_type'])
+                for row in results
+            }
             return {
                 'has_existing': True,
                 'responses': responses,
@@ -258,156 +350,82 @@ def check_existing_responses(customer_id: str, partner_company: str, template_na
             pass
         return {'has_existing': False}
 
+# Pulls the message out of helper errors that wrap a response dict, e.g. "{'message': '...'}"
+WRAPPED_ERROR_MESSAGE = re.compile(r"'message':\s*'([^']+)'")
+
 def submit_survey_responses(customer_id: str, customer_company: str, 
                            partner_name: str, partner_company: str,
                            template_name: str, responses: Dict, is_update: bool = False):
     """Submit survey responses to database"""
     try:
-        # Insert or get customer
-        customer_query = f"""
-            INSERT INTO "customers" ("customer_id", "customer_company") 
-            VALUES ({escape_sql_string(customer_id)}, {escape_sql_string(customer_company)}) 
-            ON CONFLICT ("customer_id") DO UPDATE SET "customer_company" = {escape_sql_string(customer_company)}
-        """
-        result = postgres_insert(customer_query)
-        # Check if postgres_insert returned an error (only 'message' indicates error)
-        if isinstance(result, dict) and 'message' in result:
-            raise Exception(f"Database insert error (customers): {result.get('message', 'Unknown error')}")
-        
-        # Insert or get partner and retrieve partner_id
-        partner_query = f"""
-            INSERT INTO "partners" ("partner_name", "partner_company") 
-            VALUES ({escape_sql_string(partner_name)}, {escape_sql_string(partner_company)}) 
-            ON CONFLICT ("partner_name", "partner_company") DO UPDATE SET "partner_name" = {escape_sql_string(partner_name)}
-        """
-        result = postgres_insert(partner_query)
-        # Check if postgres_insert returned an error (only 'message' indicates error)
-        if isinstance(result, dict) and 'message' in result:
-            raise Exception(f"Database insert error (partners): {result.get('message', 'Unknown error')}")
-        
-        # Get partner_id
-        partner_fetch_query = f"""
-            SELECT "id" FROM "partners" 
-            WHERE "partner_name" = {escape_sql_string(partner_name)} 
-            AND "partner_company" = {escape_sql_string(partner_company)}
-            LIMIT 1
-        """
-        partner_df = postgres_fetch(partner_fetch_query)
-        if not isinstance(partner_df, pd.DataFrame) or partner_df is None or partner_df.empty:
-            raise Exception("Failed to get partner ID")
-        partner_id = int(partner_df.iloc[0]['id'])
-        
-        # Get template ID
-        template_query = f"""
-            SELECT "id", "questions"::text as "questions" FROM "templates" WHERE "template_name" = {escape_sql_string(template_name)}
-        """
-        template_df = postgres_fetch(template_query)
-        if not isinstance(template_df, pd.DataFrame) or template_df is None or template_df.empty:
-            raise Exception(f"Template '{template_name}' not found")
-        template_id = int(template_df.iloc[0]['id'])
-        template_questions_raw = template_df.iloc[0]['questions']
-        # Parse questions JSON - handle different data types
-        if template_questions_raw is None:
-            template_questions = []
-        elif isinstance(template_questions_raw, str):
-            try:
-                parsed = json.loads(template_questions_raw)
-                template_questions = parsed if isinstance(parsed, list) else []
-            except (json.JSONDecodeError, TypeError):
-                raise Exception(f"Failed to parse questions JSON for template '{template_name}'")
-        elif isinstance(template_questions_raw, list):
-            template_questions = template_questions_raw
-        else:
-            # Try to convert and parse
-            try:
-                questions_str = str(template_questions_raw)
-                parsed = json.loads(questions_str)
-                template_questions = parsed if isinstance(parsed, list) else []
-            except (json.JSONDecodeError, TypeError):
-                raise Exception(f"Failed to parse questions for template '{template_name}'")
+        # Get template ID and questions (cached, so usually no round-trip)
+        template_id, questions_by_id = get_template_meta(template_name)
         
-        # Get previous submission ID if updating
-        previous_submission_id = None
-        if is_update:
-            # template_id is already cast to int above
-            # Get submissions by partner and template, then filter by customer_id in Python
-            prev_query = f"""
-                SELECT s."id", s."customer_id"
-                FROM "submissions" s
-                JOIN "partners" p ON s."partner_id" = p."id"
-                WHERE p."partner_name" = {escape_sql_string(partner_name)} 
-                AND p."partner_company" = {escape_sql_string(partner_company)} 
-                AND s."template_id" = {template_id}
-                ORDER BY s."id" DESC
-            """
-            prev_df = postgres_fetch(prev_query)
-            if isinstance(prev_df, pd.DataFrame) and prev_df is not None and not prev_df.empty:
-                # Filter by customer_id in Python to avoid type mismatch
-                for _, row in prev_df.iterrows():
-                    if str(row['customer_id']) == str(customer_id):
-                        previous_submission_id = int(row['id'])
-                        break
+        # Build the response rows; each takes the new submission's ID from the "s" CTE below
+        response_rows = []
+        for question_id, response_value in responses.items():
+            if response_value is not None and response_value != '':
+                # Find question details from template
+                question_detail = questions_by_id.get(question_id)
+                question_text = question_detail['question'] if question_detail else question_id
+                response_type = question_detail['type'] if question_detail else 'unknown'
+                section_name = question_detail.get('section') if question_detail else None
+                
+                response_rows.append(
+                    f"((SELECT \"id\" FROM s), {_text_literal(question_id)}, {_text_literal(question_text)}, "
+                    f"{_text_literal(_dump_response(response_value))}, {_text_literal(response_type)}, "
+                    f"{_text_literal(section_name) if section_name else 'NULL::text'})"
+                )
         
-        # Create new submission
-        # partner_id and template_id are already integers
-        # Handle previous_submission_id - use NULL if None, otherwise use integer value
-        if previous_submission_id:
-            previous_submission_id_value = int(previous_submission_id)
-        else:
-            previous_submission_id_value = 'NULL'
+        responses_cte = f""",
+            r AS (
+                INSERT INTO "responses" ("submission_id", "question_id", "question_text", "response_value", "response_type", "section_name") 
+                VALUES {', '.join(response_rows)}
+            )""" if response_rows else ""
         
+        # Upsert customer and partner, find the previous submission if updating, create the
+        # submission and insert its responses in one statement, so it all commits or none of it does
+        # (data-modifying CTEs run even though the final SELECT doesn't read them)
         submission_query = f"""
-            INSERT INTO "submissions" ("customer_id", "partner_id", "template_id", "is_update", "previous_submission_id") 
-            VALUES ({escape_sql_string(customer_id)}, {partner_id}, {template_id}, {escape_sql_string(is_update)}, {previous_submission_id_value})
-        """
-        result = postgres_insert(submission_query)
-        # Check if postgres_insert returned an error (only 'message' indicates error)
-        # Success responses may have 'return_value' and 'execution_id', which are OK
-        if isinstance(result, dict) and 'message' in result:
-            error_msg = result.get('message', str(result))
-            raise Exception(f"Database insert error (submissions): {error_msg}")
-        
-        # Get submission_id and submission_uuid
-        # Since we just inserted, get the most recent submission matching partner_id and template_id
-        # Then verify customer_id matches in Python to avoid type mismatch in SQL
-        submission_fetch_query = f"""
-            SELECT "id", "submission_uuid", "customer_id" 
-            FROM "submissions" 
-            WHERE "partner_id" = {partner_id} 
-            AND "template_id" = {template_id}
-            ORDER BY "id" DESC LIMIT 1
+            WITH c AS (
+                INSERT INTO "customers" ("customer_id", "customer_company") 
+                VALUES ({escape_sql_string(customer_id)}, {escape_sql_string(customer_company)}) 
+                ON CONFLICT ("customer_id") DO UPDATE SET "customer_company" = EXCLUDED."customer_company"
+                RETURNING "customer_id"
+            ),
+            p AS (
+                INSERT INTO "partners" ("partner_name", "partner_company") 
+                VALUES ({escape_sql_string(partner_name)}, {escape_sql_string(partner_company)}) 
+                ON CONFLICT ("partner_name", "partner_company") DO UPDATE SET "partner_name" = EXCLUDED."partner_name"
+                RETURNING "id"
+            ),
+            prev AS (
+                SELECT MAX(s2."id") as "id"
+                FROM "submissions" s2
+                JOIN "partners" p2 ON s2."partner_id" = p2."id"
+                WHERE {escape_sql_string(is_update)}
+                AND p2."partner_name" = {escape_sql_string(partner_name)} 
+                AND p2."partner_company" = {escape_sql_string(partner_company)} 
+                AND s2."template_id" = {template_id}
+                AND s2."customer_id"::text = {escape_sql_string(str(customer_id))}
+            ),
+            s AS (
+                INSERT INTO "submissions" ("customer_id", "partner_id", "template_id", "is_update", "previous_submission_id") 
+                SELECT {escape_sql_string(customer_id)}, (SELECT "id" FROM p), {template_id}, {escape_sql_string(is_update)}, (SELECT "id" FROM prev)
+                RETURNING "id", "submission_uuid"
+            ){responses_cte}
+            SELECT "id", "submission_uuid" FROM s
         """
-        submission_df = postgres_fetch(submission_fetch_query)
+        submission_df = postgres_fetch(submission_query)
         if not isinstance(submission_df, pd.DataFrame) or submission_df is None or submission_df.empty:
             raise Exception("Failed to get submission ID")
         
-        # Verify customer_id matches (handle type conversion in Python)
-        fetched_customer_id = str(submission_df.iloc[0]['customer_id'])
-        if fetched_customer_id != str(customer_id):
-            raise Exception(f"Customer ID mismatch: expected {customer_id}, got {fetched_customer_id}")
-        
         submission_id = int(submission_df.iloc[0]['id'])
         submission_uuid = submission_df.iloc[0]['submission_uuid']
         
-        # Insert responses
-        for question_id, response_value in responses.items():
-            if response_value is not None and response_value != '':
-                # Find question details from template
-                question_detail = next((q for q in template_questions if q['id'] == question_id), None)
-                question_text = question_detail['question'] if question_detail else question_id
-                response_type = question_detail['type'] if question_detail else 'unknown'
-                section_name = question_detail.get('section') if question_detail else None
-                
-                response_query = f"""
-                    INSERT INTO "responses" ("submission_id", "question_id", "question_text", "response_value", "response_type", "section_name") 
-                    VALUES ({submission_id}, {escape_sql_string(question_id)}, {escape_sql_string(question_text)}, {escape_sql_string(str(response_value))}, {escape_sql_string(response_type)}, {escape_sql_string(section_name) if section_name else 'NULL'})
-                """
-                result = postgres_insert(response_query)
-                # Check if postgres_insert returned an error (only 'message' indicates error)
-                # Success responses may have 'return_value' and 'execution_id', which are OK
-                if isinstance(result, dict) and 'message' in result:
-                    raise Exception(f"Database insert error (responses): {result.get('message', 'Unknown error')}")
-        
+        # The new submission is now the latest one for this customer/partner/template
+        has_existing_submission.clear()
+        check_existing_responses.clear()
         return {'success': True, 'submission_id': submission_id, 'submission_uuid': str(submission_uuid)}
     
     except Exception as e:
@@ -415,33 +433,73 @@ def submit_survey_responses(customer_id: str, customer_company: str,
         # Extract actual error message if it's wrapped in a dict string
         if 'connection adapters' in error_msg and '{' in error_msg:
             # Try to extract the actual error message from the wrapped dict
-            import re
-            match = re.search(r"'message':\s*'([^']+)'", error_msg)
+            match = WRAPPED_ERROR_MESSAGE.search(error_msg)
             if match:
                 error_msg = match.group(1)
         st.error(f"Error submitting responses: {error_msg}")
         return {'success': False, 'error': error_msg}
 
+def clear_survey_caches():
+    """Invalidate every cached view of the templates table"""
+    get_all_surveys.clear()
+    list_surveys.clear()
+    get_survey_questions_df.clear()
+    get_template_meta.clear()
+
 def upload_template(survey_name: str, questions: List[Dict], description: str = ""):
     """Upload a new survey template"""
     try:
-        questions_json = json.dumps(questions)
+        questions_json = orjson.dumps(questions).decode()
+        # The JSON literal is sent once; the conflict branch reuses it via EXCLUDED
         query = f"""
             INSERT INTO "templates" ("template_name", "questions", "description") 
-            VALUES ({escape_sql_string(survey_name)}, {escape_sql_string(questions_json)}, {escape_sql_string(description)}) 
+            VALUES ({escape_sql_string(survey_name)}, {escape_sql_string(questions_json)}::jsonb, {escape_sql_string(description)}) 
             ON CONFLICT ("template_name") 
-            DO UPDATE SET "questions" = {escape_sql_string(questions_json)}, "updated_date" = CURRENT_TIMESTAMP
+            DO UPDATE SET "questions" = EXCLUDED."questions", "updated_date" = CURRENT_TIMESTAMP
         """
         postgres_insert(query)
+        # Make the new/updated template visible on the next rerun
+        clear_survey_caches()
         return True
     except Exception as e:
         st.error(f"Database error: {str(e)}")
         return False
 
-def export_all_submissions():
-    """Export all submissions to Excel"""
+# Values xlsxwriter's write_row accepts as-is; anything else (UUIDs, dicts, ...) is stringified
+XLSX_NATIVE_TYPES = (str, bool, int, float, Decimal, datetime, date, time, timedelta)
+
+def _xlsx_value(value):
+    """Pass through values xlsxwriter can write natively and stringify the rest"""
+    return value if value is None or isinstance(value, XLSX_NATIVE_TYPES) else str(value)
+
+def _sheet_rows(df: pd.DataFrame):
+    """Yield DataFrame rows as plain tuples with missing values blanked out"""
+    # Convert each column to Python values once, then stitch rows together in C via zip
+    columns = []
+    for _, values in df.items():
+        column = values.astype(object).where(values.notna(), None).tolist()
+        if values.dtype == object:
+            # Only object columns can hold values xlsxwriter can't write
+            column = [_xlsx_value(value) for value in column]
+        columns.append(column)
+    return zip(*columns)
+
+def _parquet_archive(frames: Dict[str, pd.DataFrame]):
+    """Bundle DataFrames as zstd-compressed Parquet files in a ZIP archive"""
+    output = io.BytesIO()
+    # Parquet pages are already compressed, so the archive just stores them
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, frame in frames.items():
+            frame = frame.assign(submission_uuid=frame['submission_uuid'].astype(str))
+            archive.writestr(f"{name}.parquet", frame.to_parquet(engine='pyarrow', compression='zstd', index=False))
+    output.seek(0)
+    return output
+
+def export_all_submissions(export_format: str = 'xlsx'):
+    """Export all submissions to Excel (or Parquet for programmatic use)"""
     try:
-        query = """
+        # Aggregate the summary in PostgreSQL rather than grouping in pandas
+        summary_query = """
             SELECT 
                 s."submission_uuid",
                 s."submission_date",
@@ -451,45 +509,68 @@ def export_all_submissions():
                 p."partner_company",
                 t."template_name" as survey_name,
                 s."is_update",
+                COUNT(*) as response_count
+            FROM "submissions" s
+            JOIN "customers" c ON s."customer_id" = c."customer_id"
+            JOIN "partners" p ON s."partner_id" = p."id"
+            JOIN "templates" t ON s."template_id" = t."id"
+            LEFT JOIN "responses" r ON s."id" = r."submission_id"
+            GROUP BY s."submission_uuid", s."submission_date", s."customer_id", c."customer_company",
+                     p."partner_name", p."partner_company", t."template_name", s."is_update"
+            ORDER BY s."submission_uuid"
+        """
+        detailed_query = """
+            SELECT 
+                s."submission_uuid",
+                s."submission_date",
+                s."customer_id",
+                c."customer_company",
+                p."partner_name",
+                p."partner_company",
+                t."template_name" as survey_name,
+                r."section_name",
                 r."question_id",
                 r."question_text",
                 r."response_value",
-                r."response_type",
-                r."section_name"
+                r."response_type"
             FROM "submissions" s
             JOIN "customers" c ON s."customer_id" = c."customer_id"
             JOIN "partners" p ON s."partner_id" = p."id"
             JOIN "templates" t ON s."template_id" = t."id"
-            LEFT JOIN "responses" r ON s."id" = r."submission_id"
+            JOIN "responses" r ON s."id" = r."submission_id"
+            WHERE r."response_value" IS NOT NULL
             ORDER BY s."submission_date" DESC, r."question_id"
         """
         
-        df = postgres_fetch(query)
+        summary_df = postgres_fetch(summary_query)
         
         # Check if result is actually a DataFrame
-        if not isinstance(df, pd.DataFrame):
+        if not isinstance(summary_df, pd.DataFrame):
             return None
-        if df is None or df.empty:
+        if summary_df is None or summary_df.empty:
             return None
         
-        # Create Excel file with multiple sheets
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Summary sheet
-            summary_df = df.groupby(['submission_uuid', 'submission_date', 'customer_id', 
-                                     'customer_company', 'partner_name', 'partner_company', 
-                                     'survey_name', 'is_update']).size().reset_index(name='response_count')
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-            
-            # Detailed responses sheet
-            detailed_df = df[df['response_value'].notna()][['submission_uuid', 'submission_date', 
-                                                              'customer_id', 'customer_company', 
-                                                              'partner_name', 'partner_company', 
-                                                              'survey_name', 'section_name', 
-                                                              'question_id', 'question_text', 
-                                                              'response_value', 'response_type']]
-            detailed_df.to_excel(writer, sheet_name='Detailed Responses', index=False)
+        detailed_df = postgres_fetch(detailed_query)
+        if not isinstance(detailed_df, pd.DataFrame):
+            return None
         
+        if export_format == 'parquet':
+            return _parquet_archive({'summary': summary_df, 'detailed_responses': detailed_df})
+        
+        # Write raw values with xlsxwriter; constant_memory flushes each row as it is written
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'strings_to_urls': False,
+            'remove_timezone': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+        })
+        for sheet_name, sheet_df in (('Summary', summary_df), ('Detailed Responses', detailed_df)):
+            sheet = workbook.add_worksheet(sheet_name)
+            sheet.write_row(0, 0, list(sheet_df.columns))
+            for row_num, row in enumerate(_sheet_rows(sheet_df), start=1):
+                sheet.write_row(row_num, 0, row)
+        workbook.close()
         output.seek(0)
         return output
     except Exception as e:
@@ -500,73 +581,96 @@ def export_all_submissions():
 # FILE PARSING UTILITIES
 # ============================================================================
 
+def _split_column(values: pd.Series, separators: List[str]) -> List[List[str]]:
+    """Split each cell on the first separator it contains, dropping blank parts"""
+    text = values.where(values.notna(), '').map(str)
+    if text.empty:
+        return []
+    sep = pd.Series(separators[-1], index=text.index)
+    for candidate in reversed(separators[:-1]):
+        sep = sep.mask(text.str.contains(candidate, regex=False), candidate)
+    # One vectorized split per separator actually used in the file
+    parts = pd.concat([text[sep == candidate].str.split(candidate, regex=False)
+                       for candidate in sep.unique()]).reindex(text.index)
+    return [[part.strip() for part in cell if part.strip()] for cell in parts]
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_preview_df(question_rows: tuple):
+    """Build the admin preview table from (id, type, question, section, required) rows"""
+    df = pd.DataFrame.from_records(list(question_rows), columns=['ID', 'Type', 'Question', 'Section', 'Required'])
+    text = df['Question']
+    df['Question'] = text.where(text.str.len() <= 50, text.str.slice(0, 50) + '...')
+    return df
+
 def parse_survey_file(uploaded_file):
     """Parse Excel or CSV file to extract survey questions"""
+    # Cached on the file contents so widget reruns don't re-parse unchanged uploads
+    return _parse_survey_bytes(uploaded_file.name, uploaded_file.getvalue())
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _parse_survey_bytes(file_name: str, data: bytes):
+    """Parse the raw bytes of an uploaded survey file"""
     try:
         # Read file based on extension
-        if uploaded_file.name.endswith('.xlsx') or uploaded_file.name.endswith('.xls'):
-            df = pd.read_excel(uploaded_file)
-        elif uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
+        if file_name.endswith('.xlsx') or file_name.endswith('.xls'):
+            df = pd.read_excel(io.BytesIO(data))
+        elif file_name.endswith('.csv'):
+            df = pd.read_csv(io.BytesIO(data), engine='pyarrow')
         else:
             st.error("Unsupported file format. Please upload .xlsx, .xls, or .csv file.")
             return None
         
+        n = len(df)
+        
+        def column(name, default):
+            return df[name] if name in df.columns else pd.Series([default] * n, index=df.index, dtype=object)
+        
+        # Convert each column once instead of boxing every row as a Series
+        ids = df['QuestionID'].tolist() if 'QuestionID' in df.columns else [f'Q{i+1}' for i in range(n)]
+        types = column('Type', 'text').map(str).str.lower().tolist()
+        texts = column('Question', '').map(str).tolist()
+        sections = column('Section', '').map(str).tolist()
+        required = column('Required', 'No').map(str).isin(['Yes', 'TRUE', 'True', 'yes', 'true']).tolist()
+        # Try different separators for options: pipe, semicolon, comma
+        options = _split_column(column('Options', ''), ['|', ';', ','])
+        matrix_rows = _split_column(column('MatrixRows', ''), ['|', ','])
+        matrix_cols = _split_column(column('MatrixCols', ''), ['|', ','])
+        min_ratings = column('MinRating', 1).tolist()
+        max_ratings = column('MaxRating', 5).tolist()
+        depends_on = column('DependsOn', None)
+        depends_on_value = column('DependsOnValue', None)
+        has_depends_on = depends_on.notna().tolist()
+        has_depends_on_value = depends_on_value.notna().tolist()
+        depends_on = depends_on.map(str).tolist()
+        depends_on_value = depends_on_value.map(str).tolist()
+        
         questions = []
-        for idx, row in df.iterrows():
+        for i in range(n):
             question = {
-                'id': row.get('QuestionID', f'Q{idx+1}'),
-                'type': str(row.get('Type', 'text')).lower(),
-                'question': str(row.get('Question', '')),
-                'section': str(row.get('Section', '')),
-                'required': str(row.get('Required', 'No')) in ['Yes', 'TRUE', 'True', 'yes', 'true']
+                'id': ids[i],
+                'type': types[i],
+                'question': texts[i],
+                'section': sections[i],
+                'required': required[i]
             }
             
             # Handle question-specific fields
             if question['type'] in ['multiple_choice', 'multiple_choice_single_select', 'multiple_choice_multi_select']:
-                options = row.get('Options', '')
-                if pd.notna(options) and str(options).strip():
-                    # Try different separators: comma, pipe, semicolon
-                    options_str = str(options)
-                    if '|' in options_str:
-                        question['options'] = [opt.strip() for opt in options_str.split('|') if opt.strip()]
-                    elif ';' in options_str:
-                        question['options'] = [opt.strip() for opt in options_str.split(';') if opt.strip()]
-                    else:
-                        question['options'] = [opt.strip() for opt in options_str.split(',') if opt.strip()]
-                else:
-                    question['options'] = []
+                question['options'] = options[i]
             
             elif question['type'] == 'rating':
-                question['minRating'] = int(row.get('MinRating', 1))
-                question['maxRating'] = int(row.get('MaxRating', 5))
+                question['minRating'] = int(min_ratings[i])
+                question['maxRating'] = int(max_ratings[i])
             
             elif question['type'] == 'matrix':
-                matrix_rows = row.get('MatrixRows', '')
-                matrix_cols = row.get('MatrixCols', '')
-                if pd.notna(matrix_rows) and str(matrix_rows).strip():
-                    rows_str = str(matrix_rows)
-                    if '|' in rows_str:
-                        question['matrixRows'] = [r.strip() for r in rows_str.split('|') if r.strip()]
-                    else:
-                        question['matrixRows'] = [r.strip() for r in rows_str.split(',') if r.strip()]
-                else:
-                    question['matrixRows'] = []
-                    
-                if pd.notna(matrix_cols) and str(matrix_cols).strip():
-                    cols_str = str(matrix_cols)
-                    if '|' in cols_str:
-                        question['matrixCols'] = [c.strip() for c in cols_str.split('|') if c.strip()]
-                    else:
-                        question['matrixCols'] = [c.strip() for c in cols_str.split(',') if c.strip()]
-                else:
-                    question['matrixCols'] = []
+                question['matrixRows'] = matrix_rows[i]
+                question['matrixCols'] = matrix_cols[i]
             
             # Handle dependencies
-            if pd.notna(row.get('DependsOn')):
-                question['dependsOn'] = str(row['DependsOn'])
-                if pd.notna(row.get('DependsOnValue')):
-                    question['dependsOnValue'] = str(row['DependsOnValue'])
+            if has_depends_on[i]:
+                question['dependsOn'] = depends_on[i]
+                if has_depends_on_value[i]:
+                    question['dependsOnValue'] = depends_on_value[i]
             
             questions.append(question)
         
@@ -594,6 +698,9 @@ def should_show_question(question: Dict, responses: Dict) -> bool:
     current_value = responses[depends_on_id]
     
     if depends_on_value:
+        # Answers and template values are usually both strings already
+        if type(current_value) is str and type(depends_on_value) is str:
+            return current_value == depends_on_value
         return str(current_value) == str(depends_on_value)
     else:
         return bool(current_value)
@@ -638,7 +745,7 @@ def render_question(question: Dict, key_prefix: str = ""):
         return st.slider(label, min_value=min_rating, max_value=max_rating, value=value, key=key)
     
     elif q_type == 'matrix':
-        st.write(label)
+        st.markdown(f'<div class="matrix-label">{label}</div>', unsafe_allow_html=True)
         matrix_rows = question.get('matrixRows', [])
         matrix_cols = question.get('matrixCols', [])
         
@@ -648,113 +755,54 @@ def render_question(question: Dict, key_prefix: str = ""):
             st.caption(f"Debug - Rows: {matrix_rows}, Cols: {matrix_cols}")
             return ""
         
-        # Load existing responses
-        existing_matrix = {}
-        if existing_value:
-            try:
-                existing_matrix = json.loads(existing_value)
-            except:
-                pass
+        # Existing responses are kept as a dict in session state
+        existing_matrix = existing_value if isinstance(existing_value, dict) else {}
         
-        # Create matrix table using columns
-        matrix_responses = {}
-        
-        # Create a container for better styling
-        st.markdown("---")
-        
-        # Add custom CSS to hide radio button text and style the matrix
-        st.markdown("""
-        <style>
-        /* Hide the radio button labels since we have headers */
-        div[data-testid="stRadio"] label[data-baseweb="radio"] > div:last-child {
-            display: none !important;
-        }
-        /* Style the matrix container */
-        .matrix-table-container {
-            border: 1px solid #e0e0e0;
-            border-radius: 4px;
-            margin: 10px 0;
-        }
-        /* Center align radio buttons */
-        div[data-testid="stRadio"] {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        }
-        /* Reduce padding around radio buttons */
-        div[data-testid="stRadio"] > div {
-            gap: 0 !important;
+        # One editable table for the whole matrix: an answer column with a dropdown per aspect
+        matrix_df = pd.DataFrame({
+            "Aspect": matrix_rows,
+            "Rating": pd.Series([existing_matrix.get(row) for row in matrix_rows], dtype=object),
+        })
+        edited = st.data_editor(
+            matrix_df,
+            column_config={
+                "Aspect": st.column_config.TextColumn("Aspect", disabled=True),
+                "Rating": st.column_config.SelectboxColumn("Rating", options=matrix_cols),
+            },
+            hide_index=True,
+            num_rows="fixed",
+            use_container_width=True,
+            key=key
+        )
+        matrix_responses = {
+            row: choice for row, choice in zip(edited["Aspect"], edited["Rating"])
+            if isinstance(choice, str) and choice
         }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Create a clean table structure
-        st.markdown('<div class="matrix-table-container">', unsafe_allow_html=True)
-        
-        # Calculate column widths to match radio button spacing
-        # First column for aspect names, rest divided equally for radio buttons
-        num_options = len(matrix_cols)
-        col_widths = [2] + [1] * num_options
-        
-        # Header row
-        header_cols = st.columns(col_widths)
-        with header_cols[0]:
-            st.markdown('<div style="padding: 8px 12px; font-weight: bold; background-color: #f8f9fa; border-bottom: 2px solid #d0d0d0;">Aspect</div>', unsafe_allow_html=True)
-        
-        for idx, col_name in enumerate(matrix_cols):
-            with header_cols[idx + 1]:
-                st.markdown(f'<div style="padding: 8px; font-weight: bold; background-color: #f8f9fa; border-bottom: 2px solid #d0d0d0; text-align: center;">{col_name}</div>', unsafe_allow_html=True)
         
-        # Data rows with radio buttons
-        for row_idx, row_name in enumerate(matrix_rows):
-            # Get existing value for this row
-            existing_row_value = existing_matrix.get(row_name, None)
-            selected_idx = None
-            if existing_row_value and existing_row_value in matrix_cols:
-                selected_idx = matrix_cols.index(existing_row_value)
-            
-            # Create columns for this row
-            row_cols = st.columns(col_widths)
-            
-            # Aspect name in first column
-            with row_cols[0]:
-                st.markdown(f'<div style="padding: 8px 12px; border-bottom: 1px solid #e0e0e0; display: flex; align-items: center;">{row_name}</div>', unsafe_allow_html=True)
-            
-            # Create a unique key for this row's radio group
-            row_key = f"{key}_{row_name.replace(' ', '_').replace('|', '_')}_{row_idx}"
-            
-            # Place each radio button in its corresponding column
-            for col_idx, col_name in enumerate(matrix_cols):
-                with row_cols[col_idx + 1]:
-                    # Create a container with border and centered content
-                    st.markdown(f'<div style="padding: 4px; border-bottom: 1px solid #e0e0e0; text-align: center; display: flex; align-items: center; justify-content: center;">', unsafe_allow_html=True)
-                    
-                    # Single radio button for this cell
-                    is_selected = (existing_row_value == col_name)
-                    cell_key = f"{row_key}_{col_idx}"
-                    
-                    if st.radio(
-                        label=col_name,
-                        options=[col_name],
-                        index=0 if is_selected else None,
-                        key=cell_key,
-                        label_visibility="collapsed"
-                    ):
-                        matrix_responses[row_name] = col_name
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        st.markdown("---")
-        
-        return json.dumps(matrix_responses) if matrix_responses else ""
+        return matrix_responses if matrix_responses else ""
     
     else:  # default to text
         return st.text_input(label, value=existing_value, key=key)
 
-def render_survey_form(survey_config: Dict):
-    """Render complete survey form"""
+def get_survey_sections(survey_config: Dict, questions: List) -> Tuple[Dict[Any, List[int]], List[type]]:
+    """Group question indexes by section, once per template version per session"""
+    cache_key = f"sections_{survey_config.get('survey_name')}"
+    cached = st.session_state.get(cache_key)
+    if cached is None or cached[0] != survey_config.get('updated_date'):
+        sections = {}
+        invalid_types = []
+        for idx, q in enumerate(questions):
+            # Ensure q is a dict
+            if not isinstance(q, dict):
+                invalid_types.append(type(q))
+                continue
+            sections.setdefault(q.get('section', 'General'), []).append(idx)
+        cached = (survey_config.get('updated_date'), sections, invalid_types)
+        st.session_state[cache_key] = cached
+    return cached[1], cached[2]
+
+def render_survey_form(survey_config: Dict) -> Tuple[List[Dict], int]:
+    """Render complete survey form and return the questions currently visible plus how many are answered"""
     # Safely get questions and ensure it's a list
     questions_raw = survey_config.get('questions', [])
     
@@ -764,9 +812,9 @@ def render_survey_form(survey_config: Dict):
     elif isinstance(questions_raw, str):
         # Try to parse as JSON
         try:
-            parsed = json.loads(questions_raw)
+            parsed = orjson.loads(questions_raw)
             questions = parsed if isinstance(parsed, list) else []
-        except (json.JSONDecodeError, TypeError):
+        except (orjson.JSONDecodeError, TypeError):
             st.error(f"Failed to parse questions JSON. Raw value type: {type(questions_raw)}")
             questions = []
     elif isinstance(questions_raw, list):
@@ -778,42 +826,42 @@ def render_survey_form(survey_config: Dict):
                 questions = [questions_raw]  # Single question as dict
             else:
                 questions_str = str(questions_raw)
-                parsed = json.loads(questions_str)
+                parsed = orjson.loads(questions_str)
                 questions = parsed if isinstance(parsed, list) else []
-        except (json.JSONDecodeError, TypeError):
+        except (orjson.JSONDecodeError, TypeError):
             st.error(f"Unexpected questions format. Type: {type(questions_raw)}")
             questions = []
     
     if not questions:
         st.warning("⚠️ No questions found in this survey template.")
-        return
+        return [], 0
     
-    # Group questions by section
-    sections = {}
-    for q in questions:
-        # Ensure q is a dict
-        if not isinstance(q, dict):
-            st.warning(f"Skipping invalid question format: {type(q)}")
-            continue
-        section = q.get('section', 'General')
-        if section not in sections:
-            sections[section] = []
-        sections[section].append(q)
+    # Group questions by section (memoized in session state per template version)
+    sections, invalid_types = get_survey_sections(survey_config, questions)
+    for invalid_type in invalid_types:
+        st.warning(f"Skipping invalid question format: {invalid_type}")
     
-    # Render sections
-    for section_name, section_questions in sections.items():
+    # Render sections, recording visibility in the same pass so progress and
+    # submit validation reuse it instead of re-evaluating every dependency
+    responses = st.session_state.survey_responses
+    visible_questions = []
+    answered_questions = 0
+    for section_name, section_indexes in sections.items():
         st.markdown(f'<div class="section-header">📋 {section_name}</div>', unsafe_allow_html=True)
         
-        for question in section_questions:
-            if should_show_question(question, st.session_state.survey_responses):
+        for idx in section_indexes:
+            question = questions[idx]
+            if should_show_question(question, responses):
                 response = render_question(question, key_prefix=f"survey_{section_name}")
-                st.session_state.survey_responses[question['id']] = response
-    
-    # Progress indicator
-    total_questions = len([q for q in questions if should_show_question(q, st.session_state.survey_responses)])
-    answered_questions = len([q for q in questions if should_show_question(q, st.session_state.survey_responses) 
-                              and st.session_state.survey_responses.get(q['id'])])
+                responses[question['id']] = response
+                visible_questions.append(question)
+                if response:
+                    answered_questions += 1
     
+    return visible_questions, answered_questions
+
+def render_progress(answered_questions: int, total_questions: int):
+    """Render progress indicator"""
     if total_questions > 0:
         progress = answered_questions / total_questions
         st.progress(progress)
@@ -856,15 +904,12 @@ def render_admin_mode():
             if all_questions:
                 st.write(f"**Total Questions:** {len(all_questions)}")
                 
-                # Preview questions
-                with st.expander("Preview Questions"):
-                    preview_df = pd.DataFrame([{
-                        'ID': q['id'],
-                        'Type': q['type'],
-                        'Question': q['question'][:50] + '...' if len(q['question']) > 50 else q['question'],
-                        'Section': q.get('section', ''),
-                        'Required': q.get('required', False)
-                    } for q in all_questions])
+                # Preview questions (only built when the toggle is on)
+                if st.toggle("Preview Questions", key="preview_open"):
+                    preview_df = build_preview_df(tuple(
+                        (q['id'], q['type'], q['question'], q.get('section', ''), q.get('required', False))
+                        for q in all_questions
+                    ))
                     st.dataframe(preview_df, use_container_width=True)
                 
                 if st.button("💾 Save Survey Template", type="primary"):
@@ -876,25 +921,26 @@ def render_admin_mode():
     
     # Tab 2: View Surveys
     with tab2:
-        st.subheader("Available Surveys")
-        surveys = get_all_surveys()
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.subheader("Available Surveys")
+        with col2:
+            # Survey lists are cached; templates written by other apps show up after a refresh
+            if st.button("🔄 Refresh", use_container_width=True):
+                clear_survey_caches()
+        surveys = list_surveys()
         
         if surveys:
             for survey in surveys:
-                with st.expander(f"📋 {survey['survey_name']} ({len(survey['questions'])} questions)"):
+                with st.expander(f"📋 {survey['survey_name']} ({survey['question_count']} questions)"):
                     st.write(f"**Description:** {survey.get('description', 'N/A')}")
                     st.write(f"**Created:** {survey['created_date']}")
                     st.write(f"**Last Updated:** {survey['updated_date']}")
                     
-                    # Show questions
-                    questions_df = pd.DataFrame([{
-                        'ID': q['id'],
-                        'Type': q['type'],
-                        'Question': q['question'],
-                        'Section': q.get('section', ''),
-                        'Required': q.get('required', False)
-                    } for q in survey['questions']])
-                    st.dataframe(questions_df, use_container_width=True)
+                    # Show questions (expander bodies always run, so build the table on demand)
+                    if st.toggle("Show Questions", key=f"show_questions_{survey['survey_name']}"):
+                        questions_df = get_survey_questions_df(survey['survey_name'], survey['updated_date'])
+                        st.dataframe(questions_df, use_container_width=True)
         else:
             st.info("No surveys available. Upload a template to get started.")
     
@@ -902,16 +948,29 @@ def render_admin_mode():
     with tab3:
         st.subheader("Export Survey Data")
         
-        if st.button("📥 Export All Submissions to Excel", type="primary"):
-            with st.spinner("Generating Excel file..."):
-                excel_file = export_all_submissions()
+        export_format = st.radio(
+            "Format",
+            options=['xlsx', 'parquet'],
+            format_func=lambda fmt: "Excel (.xlsx)" if fmt == 'xlsx' else "Parquet (.zip, for programmatic use)",
+            horizontal=True
+        )
+        
+        if st.button("📥 Export All Submissions", type="primary"):
+            with st.spinner("Generating export file..."):
+                export_file = export_all_submissions(export_format)
                 
-                if excel_file:
+                if export_file:
+                    if export_format == 'parquet':
+                        file_name = f"All_Submissions_Export_{datetime.now().strftime('%Y%m%d')}.zip"
+                        mime = "application/zip"
+                    else:
+                        file_name = f"All_Submissions_Export_{datetime.now().strftime('%Y%m%d')}.xlsx"
+                        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     st.download_button(
-                        label="⬇️ Download Excel File",
-                        data=excel_file,
-                        file_name=f"All_Submissions_Export_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        label="⬇️ Download Export File",
+                        data=export_file,
+                        file_name=file_name,
+                        mime=mime
                     )
                     st.success("✅ Export ready for download!")
                 else:
@@ -933,23 +992,27 @@ def render_partner_mode():
     if 'selected_survey' not in st.session_state:
         st.session_state.selected_survey = None
     if 'existing_responses_checked' not in st.session_state:
-        st.session_state.existing_responses_checked = False
-    
-    # Step 1: Partner Information
-    st.subheader("1️⃣ Partner Information")
-    col1, col2 = st.columns(2)
-    with col1:
-        partner_name = st.text_input("Partner User Name *", placeholder="Your name")
-    with col2:
-        partner_company = st.text_input("Partner Company *", placeholder="Your company name")
+        st.session_state.existing_responses_checked = None
     
-    # Step 2: Customer Selection
-    st.subheader("2️⃣ Select Customer")
-    search_term = st.text_input("🔍 Search Customer", placeholder="Search by company name or ID")
+    # Steps 1-2 are batched in a form so typing doesn't rerun the script (and its queries)
+    # Form widgets keep their last submitted values across reruns
+    with st.form("partner_setup"):
+        # Step 1: Partner Information
+        st.subheader("1️⃣ Partner Information")
+        col1, col2 = st.columns(2)
+        with col1:
+            partner_name = st.text_input("Partner User Name *", placeholder="Your name")
+        with col2:
+            partner_company = st.text_input("Partner Company *", placeholder="Your company name")
+        
+        # Step 2: Customer Selection
+        st.subheader("2️⃣ Select Customer")
+        search_term = st.text_input("🔍 Search Customer", placeholder="Search by company name or ID")
+        st.form_submit_button("Continue")
     
-    customers = get_customers(search_term)
-    if customers:
-        customer_options = {f"{c['customer_company']} ({c['customer_id']})": c for c in customers}
+    # Normalized here so equivalent searches share a cache entry
+    customer_options = get_customer_options(search_term.strip().lower())
+    if customer_options:
         selected_customer_key = st.selectbox(
             "Select Customer",
             options=[""] + list(customer_options.keys())
@@ -970,10 +1033,9 @@ def render_partner_mode():
     
     # Step 3: Survey Selection
     st.subheader("3️⃣ Select Survey")
-    surveys = get_all_surveys()
+    survey_options = {s['survey_name']: s for s in get_all_surveys()}
     
-    if surveys:
-        survey_options = {s['survey_name']: s for s in surveys}
+    if survey_options:
         selected_survey_name = st.selectbox(
             "Choose Survey",
             options=[""] + list(survey_options.keys())
@@ -993,14 +1055,24 @@ def render_partner_mode():
                 desc = 'No description'
             st.info(f"📋 {desc} ({question_count} questions)")
     
-    # Step 4: Check for existing responses
-    if (st.session_state.selected_customer and st.session_state.selected_survey and 
-        partner_company and not st.session_state.existing_responses_checked):
-        
+    # Step 4: Check for existing responses (once per customer/partner company/survey combination)
+    if st.session_state.selected_customer and st.session_state.selected_survey and partner_company:
         customer_id = st.session_state.selected_customer['customer_id']
         template_name = st.session_state.selected_survey['survey_name']
+        check_key = (customer_id, partner_company, template_name)
+    else:
+        check_key = None
+    
+    if check_key and st.session_state.existing_responses_checked != check_key:
+        # A new selection starts from a blank form; answers for the previous one must not carry over
+        st.session_state.survey_responses = {}
+        st.session_state.is_update = False
         
-        existing_data = check_existing_responses(customer_id, partner_company, template_name)
+        # Only fetch the previous answers when a previous submission exists
+        if has_existing_submission(customer_id, partner_company, template_name):
+            existing_data = check_existing_responses(customer_id, partner_company, template_name)
+        else:
+            existing_data = {'has_existing': False}
         
         if existing_data['has_existing']:
             st.warning(f"""
@@ -1013,65 +1085,72 @@ def render_partner_mode():
             """)
             st.session_state.survey_responses = existing_data['responses']
             st.session_state.is_update = True
-        else:
-            st.session_state.is_update = False
         
-        st.session_state.existing_responses_checked = True
+        st.session_state.existing_responses_checked = check_key
     
     # Step 5: Survey Form
     if st.session_state.selected_customer and st.session_state.selected_survey and partner_name and partner_company:
         st.markdown("---")
         st.subheader("4️⃣ Complete Survey")
         
-        render_survey_form(st.session_state.selected_survey)
+        survey = st.session_state.selected_survey
         
-        # Submit button
-        st.markdown("---")
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("📤 Submit Survey", type="primary", use_container_width=True):
-                # Validate required fields
-                questions = st.session_state.selected_survey['questions']
-                missing_required = []
-                
-                for q in questions:
-                    if q.get('required') and should_show_question(q, st.session_state.survey_responses):
-                        if not st.session_state.survey_responses.get(q['id']):
-                            missing_required.append(q['question'])
+        # Batch all answers into one rerun on submit instead of one per widget change
+        with st.form(key=f"survey_form_{survey['survey_name']}", clear_on_submit=False):
+            visible_questions, answered_count = render_survey_form(survey)
+            
+            if any(isinstance(q, dict) and 'dependsOn' in q for q in survey.get('questions') or []):
+                st.caption("ℹ️ Follow-up questions based on your answers appear after you submit.")
+            
+            # Submit button
+            st.markdown("---")
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col2:
+                submitted = st.form_submit_button("📤 Submit Survey", type="primary", use_container_width=True)
+        
+        # Widgets inside a form don't update mid-form, so progress lives outside it
+        render_progress(answered_count, len(visible_questions))
+        
+        if submitted:
+            # Validate required fields (visibility was already evaluated by render_survey_form)
+            missing_required = [
+                q['question'] for q in visible_questions
+                if q.get('required') and not st.session_state.survey_responses.get(q['id'])
+            ]
+            
+            if missing_required:
+                st.error(f"❌ Please answer all required questions. Missing: {', '.join(missing_required[:3])}")
+            else:
+                # Submit responses
+                result = submit_survey_responses(
+                    customer_id=st.session_state.selected_customer['customer_id'],
+                    customer_company=st.session_state.selected_customer['customer_company'],
+                    partner_name=partner_name,
+                    partner_company=partner_company,
+                    template_name=st.session_state.selected_survey['survey_name'],
+                    responses=st.session_state.survey_responses,
+                    is_update=st.session_state.get('is_update', False)
+                )
                 
-                if missing_required:
-                    st.error(f"❌ Please answer all required questions. Missing: {', '.join(missing_required[:3])}")
-                else:
-                    # Submit responses
-                    result = submit_survey_responses(
-                        customer_id=st.session_state.selected_customer['customer_id'],
-                        customer_company=st.session_state.selected_customer['customer_company'],
-                        partner_name=partner_name,
-                        partner_company=partner_company,
-                        template_name=st.session_state.selected_survey['survey_name'],
-                        responses=st.session_state.survey_responses,
-                        is_update=st.session_state.get('is_update', False)
-                    )
-                    
-                    if result and result.get('success'):
-                        st.success(f"""
-                            ✅ **Survey Submitted Successfully!**
-                            
-                            Submission ID: {result['submission_uuid']}
-                            
-                            Thank you for completing the survey!
-                        """)
-                        st.balloons()
+                if result and result.get('success'):
+                    st.success(f"""
+                        ✅ **Survey Submitted Successfully!**
                         
-                        # Reset form
-                        if st.button("Start New Survey"):
-                            st.session_state.survey_responses = {}
-                            st.session_state.selected_customer = None
-                            st.session_state.selected_survey = None
-                            st.session_state.existing_responses_checked = False
-                            st.rerun()
-                    else:
-                        st.error(f"❌ Failed to submit survey: {result.get('error', 'Unknown error')}")
+                        Submission ID: {result['submission_uuid']}
+                        
+                        Thank you for completing the survey!
+                    """)
+                    st.balloons()
+                    
+                    # Reset form
+                    if st.button("Start New Survey"):
+                        st.session_state.survey_responses = {}
+                        st.session_state.selected_customer = None
+                        st.session_state.selected_survey = None
+                        st.session_state.existing_responses_checked = None
+                        st.rerun()
+                else:
+                    st.error(f"❌ Failed to submit survey: {result.get('error', 'Unknown error')}")
     
     elif not (partner_name and partner_company):
         st.info("👆 Please enter your partner information to continue")
@@ -1080,6 +1159,28 @@ def render_partner_mode():
     elif not st.session_state.selected_survey:
         st.info("👆 Please select a survey to continue")
 
+# ============================================================================
+# CONNECTION HEALTH CHECK AND MIGRATIONS
+# ============================================================================
+
+@st.cache_data(ttl=30, show_spinner=False)  # Re-check at most every 30 seconds
+def check_db_connection():
+    """Ping the database; raises if the connection fails (failures are not cached)"""
+    postgres_fetch("SELECT 1 as test")
+    return True
+
+@st.cache_resource(show_spinner=False)
+def apply_schema_migrations():
+    """Apply idempotent index migrations (trigram search indexes etc.) once per server process"""
+    # Failures are returned rather than raised so they are cached too and the DDL isn't retried every rerun
+    try:
+        migrations_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_migrations.sql")
+        with open(migrations_path) as f:
+            postgres_insert(f.read())
+    except Exception as e:
+        return str(e)
+    return None
+
 # ============================================================================
 # MAIN APPLICATION
 # ============================================================================
@@ -1098,8 +1199,7 @@ def main():
     
     # Connection status - test with a simple query
     try:
-        test_query = "SELECT 1 as test"
-        postgres_fetch(test_query)
+        check_db_connection()
         st.sidebar.success("✅ Database Connected")
     except Exception as e:
         st.sidebar.error("❌ Database Connection Failed")
@@ -1107,6 +1207,11 @@ def main():
         st.info("Please ensure the gocobalt helper functions are properly configured with writeback database credentials.")
         return
     
+    # Migrations only add optional indexes, so the app keeps working without them
+    migration_error = apply_schema_migrations()
+    if migration_error:
+        st.sidebar.warning(f"⚠️ Schema migrations not applied: {migration_error}")
+    
     # Mode selection
     mode = st.sidebar.radio(
         "Select Mode:",
@@ -0,0 +1,39 @@
+-- Performance indexes for the Partner Survey System
+-- Safe to run repeatedly; every statement is idempotent.
+
+-- Latest-submission lookup in check_existing_responses
+CREATE INDEX IF NOT EXISTS submissions_lookup
+    ON submissions (customer_id, partner_id, template_id, id DESC);
+
+-- Customer search in get_customers uses ILIKE '%term%', which a B-Tree
+-- cannot serve. Trigram GIN indexes let the planner avoid a sequential scan.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS customers_company_trgm
+    ON customers USING gin (customer_company gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS customers_id_trgm
+    ON customers USING gin (customer_id gin_trgm_ops);
+
+-- Cheaper than trigrams for prefix-only searches ('term%')
+CREATE INDEX IF NOT EXISTS customers_company_prefix
+    ON customers (customer_company text_pattern_ops);
+
+-- Questions keyed by ID, maintained by PostgreSQL on every template write so
+-- submit_survey_responses can look up question details without rebuilding
+-- the map. Generated columns can't contain subqueries, hence the function.
+CREATE OR REPLACE FUNCTION template_questions_by_id(questions jsonb)
+RETURNS jsonb
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT COALESCE(jsonb_object_agg(q->>'id', q), '{}'::jsonb)
+    FROM jsonb_array_elements(
+        CASE WHEN jsonb_typeof(questions) = 'array' THEN questions ELSE '[]'::jsonb END
+    ) AS q
+    WHERE q->>'id' IS NOT NULL
+$$;
+
+ALTER TABLE templates
+    ADD COLUMN IF NOT EXISTS questions_by_id jsonb
+    GENERATED ALWAYS AS (template_questions_by_id(questions)) STORED;